@@ -1,58 +1,374 @@
-# Calculates average from input CSV file, must be in the same directory
+# Calculates average from input CSV file(s)
 # Interactable CLI program
+# Usage: python average_calculator.py [file or directory ...]
+# Reads John_Transcript.CSV in the current directory if no path is given;
+# a directory is read as every .csv file directly inside it, in alphabetical order.
 # The CSV file must be formatted so that:
 ### The first row is ignored
 ### Each row has 6 columns separated by commas in the following order:
 ### subject code, course code, final grade, credit units, semester, year.
+### Entries containing commas may be quoted.
+# Rows that do not have 6 columns are reported and skipped
 # The final grade is ignored if it is a text
 
+import csv
+import os
+import sys
 from typing import *
 from tabulate import tabulate
-from copy import deepcopy
+import numpy as np
 
 
-def compute_average(grade: List[str], credit: List[str]) -> float:
+class Transcript:
     """
-    Computes the weighted average of the given grades.
-    For example, if you received 80 and 90 with 3 and 6 credits respectively,
-    then the weighted average is 86.6667. Any non-numeric grade/credit entry
-    will be ignored.
+    Columnar store for the transcript database.
+    The six columns SBJ, CRS, GRD, CRD, SEM, YER are kept as they were read for display,
+    and are parsed once into typed arrays for computation:
+    grade and credit are float arrays holding NaN for non-numeric entries, valid marks the entries
+    where both are numeric, and subjects and semesters are stored as integer codes into their sorted categories.
+    Indexing by a key such as data["SBJ"] returns the column as read.
+    The indexes for Predicate are built by build_indexes().
+    """
+    KEYS = ("SBJ", "CRS", "GRD", "CRD", "SEM", "YER")
+    HASHED = ("SBJ", "SEM", "YER")   # keys with a hash index
+    SORTED = ("level", "number")   # course level and number, with a sorted index
+    _hashed = None
+    _sorted = None
 
-    :param grade: A list of numeric grades.
-    :param credit: A list of credit units associated with each grade in the respective order.
-    :return: The weighted average of the input grades.
+    def __init__(self, columns: Dict[str, Sequence[str]]):
+        """
+        :param columns: A dictionary mapping each of the keys SBJ, CRS, GRD, CRD, SEM, YER to a list of strings.
+        """
+        n = len(columns["SBJ"])
+        assert all(len(columns[key]) == n for key in self.KEYS), "Columns do not agree in length."
+        self.columns = {}
+        for key in self.KEYS:
+            # an object array keeps the strings as they are and can still be indexed by a mask
+            self.columns[key] = np.empty(n, dtype=object)
+            self.columns[key][:] = columns[key]
+        self.grade = parse_numbers(self.columns["GRD"])
+        self.credit = parse_numbers(self.columns["CRD"])
+        self.valid = ~np.isnan(self.grade) & ~np.isnan(self.credit)
+        self.subjects, self.subject_codes = encode(self.columns["SBJ"])
+        self.semesters, self.semester_codes = encode(self.columns["SEM"])
+
+    def __len__(self) -> int:
+        return len(self.columns["SBJ"])
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        return self.columns[key]
+
+    def take(self, rows: np.ndarray) -> "Transcript":
+        """
+        Returns a new Transcript with only the given rows, without parsing anything again.
+        The categories are shared with this Transcript, so the codes stay comparable.
+
+        :param rows: A boolean mask over the rows, or an array of row indices.
+        :return: The Transcript with the selected rows.
+        """
+        result = Transcript.__new__(Transcript)
+        result.columns = {key: column[rows] for key, column in self.columns.items()}
+        result.grade = self.grade[rows]
+        result.credit = self.credit[rows]
+        result.valid = self.valid[rows]
+        result.subjects, result.subject_codes = self.subjects, self.subject_codes[rows]
+        result.semesters, result.semester_codes = self.semesters, self.semester_codes[rows]
+        return result
+
+    def extended(self, rows: List[List[str]]) -> "Transcript":
+        """
+        Returns a new Transcript with the given rows added at the end; this Transcript is left unchanged.
+
+        :param rows: Rows to add, each a list of 6 strings for the keys SBJ, CRS, GRD, CRD, SEM, YER in the respective order.
+        :return: The extended Transcript.
+        """
+        columns = {key: list(self.columns[key]) for key in self.KEYS}
+        for row in rows:
+            for key, entry in zip(self.KEYS, row):
+                columns[key].append(entry)
+        return Transcript(columns)
+
+    def build_indexes(self) -> None:
+        """
+        Builds the indexes used by Predicate: a hash index from each value of SBJ, SEM and YER
+        to the rows holding it, and sorted indexes on the course level and course number (see course_numbers()).
+        load_database() builds them once for the loaded database; a Transcript made otherwise
+        builds them the first time a Predicate needs them.
+        """
+        self._hashed = {"SBJ": group_rows(self.subjects, self.subject_codes),
+                        "SEM": group_rows(self.semesters, self.semester_codes),
+                        "YER": group_rows(*encode(self.columns["YER"]))}
+        self._sorted = {}
+        for name, numbers in zip(self.SORTED, course_numbers(self.columns["CRS"])):
+            order = np.argsort(numbers, kind="stable")   # NaN for non-numeric course codes sorts last
+            self._sorted[name] = (order, numbers[order])
+
+    def hash_index(self, key: str) -> Dict[str, np.ndarray]:
+        """
+        :param key: One of SBJ, SEM, YER.
+        :return: The dictionary from each value of the column to the indices of the rows holding it.
+        """
+        if self._hashed is None:
+            self.build_indexes()
+        return self._hashed[key]
+
+    def sorted_index(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param name: Either "level" or "number".
+        :return: The row indices in ascending order of the course level or number, and the sorted levels or numbers.
+        """
+        if self._sorted is None:
+            self.build_indexes()
+        return self._sorted[name]
+
+
+def group_rows(categories: np.ndarray, codes: np.ndarray) -> Dict[str, np.ndarray]:
     """
-    n = len(grade)
-    assert n == len(credit), "List for grades and credits do not agree in length."
-    total_grade_weighted = 0
-    total_credit = 0
-    for i in range(n):
-        if grade[i].isnumeric() and credit[i].isnumeric():
-            total_grade_weighted += float(grade[i]) * float(credit[i])
-            total_credit += float(credit[i])
-    return total_grade_weighted / total_credit
+    Groups the rows by their categorical code, with one stable argsort of the codes.
+
+    :param categories: The sorted unique values, as from encode().
+    :param codes: The code of each row into categories.
+    :return: The dictionary from each value that occurs to the indices of the rows holding it, in ascending order.
+    """
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+    return {categories[i]: order[bounds[i]:bounds[i + 1]]
+            for i in range(len(categories)) if bounds[i] < bounds[i + 1]}
+
+
+def course_numbers(column: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parses the course codes into course levels and numbers.
+    The level is the first digit of the course code (2 for 201) and the number is its leading digits (201 for 201A).
+    Course codes that do not start with a digit get NaN for both.
+
+    :param column: The course codes.
+    :return: The float arrays of levels and numbers.
+    """
+    levels = np.full(len(column), np.nan)
+    numbers = np.full(len(column), np.nan)
+    for i, code in enumerate(column):
+        digits = len(code) - len(code.lstrip("0123456789"))
+        if digits:
+            levels[i] = int(code[0])
+            numbers[i] = int(code[:digits])
+    return levels, numbers
+
+
+class Predicate:
+    """
+    A condition on one column that filter_database() answers from the indexes of a Transcript
+    instead of calling a function on every row. Make one with equals(), one_of() or between().
+    """
+
+    def __init__(self, key: str, values: Optional[Collection[str]] = None,
+                 low: Optional[float] = None, high: Optional[float] = None):
+        """
+        :param key: For values, one of SBJ, CRS, GRD, CRD, SEM, YER.
+                    For a range, one of level, number (course level/number, see course_numbers()), GRD or CRD.
+        :param values: The entries to match exactly; if None, the range from low to high is matched instead.
+        :param low: The inclusive lower bound of the range, or None for no lower bound.
+        :param high: The inclusive upper bound of the range, or None for no upper bound.
+        """
+        if values is None:
+            assert key in Transcript.SORTED + ("GRD", "CRD"), "Cannot take a range of {}.".format(key)
+        else:
+            assert key in Transcript.KEYS, "Unknown key {}.".format(key)
+        self.key = key
+        self.values = values
+        self.low = -np.inf if low is None else low
+        self.high = np.inf if high is None else high
+
+    def mask(self, data: Transcript) -> np.ndarray:
+        """
+        :param data: The database to evaluate the condition on.
+        :return: A boolean mask of the rows of data that satisfy the condition.
+        """
+        if self.values is not None:
+            if self.key not in Transcript.HASHED:
+                return np.isin(data[self.key], list(self.values))
+            index = data.hash_index(self.key)
+            result = np.zeros(len(data), dtype=bool)
+            for value in self.values:
+                if value in index:
+                    result[index[value]] = True
+            return result
+        if self.key in Transcript.SORTED:
+            order, numbers = data.sorted_index(self.key)
+            result = np.zeros(len(data), dtype=bool)
+            result[order[np.searchsorted(numbers, self.low, 'left'):np.searchsorted(numbers, self.high, 'right')]] = True
+            return result
+        numbers = data.grade if self.key == "GRD" else data.credit
+        return (numbers >= self.low) & (numbers <= self.high)   # NaN compares False
+
+
+def equals(key: str, value: str) -> Predicate:
+    """
+    :param key: One of SBJ, CRS, GRD, CRD, SEM, YER.
+    :param value: The entry to match.
+    :return: The condition that the entry of key is value, to be passed into filter_database().
+    """
+    return Predicate(key, values=(value,))
+
+
+def one_of(key: str, values: Iterable[str]) -> Predicate:
+    """
+    :param key: One of SBJ, CRS, GRD, CRD, SEM, YER.
+    :param values: The entries to match.
+    :return: The condition that the entry of key is one of values, to be passed into filter_database().
+    """
+    return Predicate(key, values=set(values))
+
+
+def between(key: str, low: Optional[float] = None, high: Optional[float] = None) -> Predicate:
+    """
+    :param key: One of level, number (course level/number, see course_numbers()), GRD or CRD.
+    :param low: The inclusive lower bound, or None for no lower bound.
+    :param high: The inclusive upper bound, or None for no upper bound.
+    :return: The condition that the value of key is in the range, to be passed into filter_database().
+             Non-numeric entries never satisfy it.
+    """
+    return Predicate(key, low=low, high=high)
+
+
+def parse_numbers(column: np.ndarray) -> np.ndarray:
+    """
+    Parses a column of strings into a float array, with NaN for any entry that is not numeric.
+
+    :param column: The strings to parse.
+    :return: The parsed float array.
+    """
+    result = np.full(len(column), np.nan)
+    for i, entry in enumerate(column):
+        if entry.isnumeric():
+            try:
+                result[i] = float(entry)
+            except ValueError:   # numeric characters that float() does not read, such as fractions
+                pass
+    return result
+
+
+def encode(column: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes a column of strings as integer codes into its sorted unique values.
+
+    :param column: The strings to encode.
+    :return: The sorted unique values, and the code of each entry.
+    """
+    if len(column) == 0:
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.intp)
+    categories, codes = np.unique(column, return_inverse=True)
+    return categories, codes.reshape(-1)
 
 
-def get_subjects(sbj: List[str]) -> List[str]:
+def concatenate(parts: List[Transcript]) -> Transcript:
     """
-    Returns a list of unique subjects in the given list of subjects.
-    :param sbj: A list of subjects to search through.
-    :return: Unique subjects in the given list of subjects.
+    Joins Transcripts end to end into one, without parsing anything again.
+    The categories of the parts are merged and their codes are mapped onto the merged categories.
+
+    :param parts: The Transcripts to join, in order; there must be at least one.
+    :return: The joined Transcript.
     """
-    result = []
-    for sub in sbj:
-        if sub not in result:
-            result.append(sub)
+    if len(parts) == 1:
+        return parts[0]
+    result = Transcript.__new__(Transcript)
+    result.columns = {key: np.concatenate([part.columns[key] for part in parts]) for key in Transcript.KEYS}
+    result.grade = np.concatenate([part.grade for part in parts])
+    result.credit = np.concatenate([part.credit for part in parts])
+    result.valid = np.concatenate([part.valid for part in parts])
+    for name in ("subject", "semester"):
+        categories = [getattr(part, name + "s") for part in parts]
+        merged = np.unique(np.concatenate(categories))
+        codes = [np.searchsorted(merged, category).astype(np.intp)[getattr(part, name + "_codes")]
+                 for part, category in zip(parts, categories)]
+        setattr(result, name + "s", merged)
+        setattr(result, name + "_codes", np.concatenate(codes))
     return result
 
 
-def tabulate_database(data: dict) -> None:
+def csv_paths(paths: Iterable[str]) -> Iterator[str]:
+    """
+    Lists the CSV files to read from the given paths.
+    A directory stands for every .csv file (in any letter case) directly inside it, in alphabetical order.
+
+    :param paths: Paths to CSV files or directories.
+    :return: An iterator over the paths to CSV files.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(".csv") and os.path.isfile(os.path.join(path, name)):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def load_database(*paths: str, chunk: int = 65536) -> Transcript:
+    """
+    Reads the transcript database from CSV files, streaming each file row by row.
+    Rows are gathered into chunks of at most chunk rows, and each chunk is parsed into a Transcript
+    before the next one is read, so only one chunk of raw rows is held at a time.
+    The first row of each file is ignored, and rows that do not have 6 columns are reported and skipped.
+
+    :param paths: Paths to CSV files or directories of CSV files, see csv_paths().
+    :param chunk: The number of rows to parse at once.
+    :return: The database of every valid row, in the order they were read, with its indexes built.
+    """
+    assert chunk > 0, "chunk must be positive"
+    parts = []
+    columns = {key: [] for key in Transcript.KEYS}
+    for path in csv_paths(paths):
+        with open(path, 'r', newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)   # header
+            for row in reader:
+                if not row:   # blank line
+                    continue
+                if len(row) != len(Transcript.KEYS):
+                    print("Skipped malformed row at {}:{} (expected {} columns, found {}): {}"
+                          .format(path, reader.line_num, len(Transcript.KEYS), len(row), ','.join(row)),
+                          file=sys.stderr)
+                    continue
+                for key, entry in zip(Transcript.KEYS, row):
+                    columns[key].append(entry.strip())
+                if len(columns["SBJ"]) == chunk:
+                    parts.append(Transcript(columns))
+                    columns = {key: [] for key in Transcript.KEYS}
+    if columns["SBJ"] or not parts:
+        parts.append(Transcript(columns))
+    database = concatenate(parts)
+    database.build_indexes()
+    return database
+
+
+def compute_average(grade: np.ndarray, credit: np.ndarray, valid: Optional[np.ndarray] = None) -> float:
+    """
+    Computes the weighted average of the given grades.
+    For example, if you received 80 and 90 with 3 and 6 credits respectively,
+    then the weighted average is 86.6667. Any non-numeric grade/credit entry
+    (stored as NaN) will be ignored.
+
+    :param grade: A float array of grades, as in Transcript.grade.
+    :param credit: A float array of credit units associated with each grade in the respective order.
+    :param valid: The mask of the entries where both grade and credit are numeric, as in Transcript.valid.
+                  It is worked out from the NaNs if not given.
+    :return: The weighted average of the input grades.
+    """
+    assert len(grade) == len(credit), "Arrays for grades and credits do not agree in length."
+    if valid is None:
+        valid = ~np.isnan(grade) & ~np.isnan(credit)
+    total_grade_weighted = float(np.dot(grade[valid], credit[valid]))
+    total_credit = float(credit[valid].sum())
+    return total_grade_weighted / total_credit
+
+
+def tabulate_database(data: Transcript) -> None:
     """
     Prints to the console a table showing the content of the database.
     Entries are sorted in alphabetical order by subject name, then by
     the course code.
 
-    :param data: The database dictionary to be printed.
+    :param data: The database to be printed.
     """
     # Convert database dictionary to list of lists
     table = []
@@ -66,17 +382,16 @@ def tabulate_database(data: dict) -> None:
     print(tabulate(table, headers=["Subject", "Course Code", "Grade", "Credit", "Semester", "Year"]))
 
 
-def print_credit_average(data: dict) -> None:
+def print_credit_average(data: Transcript) -> None:
     """
     Prints to the console the number of courses taken, the total credits earned,
     and the weighted average.
 
-    :param data: The database dictionary to base the calculation off of.
+    :param data: The database to base the calculation off of.
     """
-    print("You have taken {} courses and earned {} credit units so far.".format(len(data["SBJ"]),
-                                                                                sum([float(n) for n in data["CRD"]
-                                                                                     if n.isnumeric()])))
-    print("Your overall weighted average is {}.".format(compute_average(data["GRD"], data["CRD"])))
+    print("You have taken {} courses and earned {} credit units so far.".format(len(data),
+                                                                                float(np.nansum(data.credit))))
+    print("Your overall weighted average is {}.".format(compute_average(data.grade, data.credit, data.valid)))
 
 
 def take_input_criteria(*criteria: Callable[[str], bool]) -> str:
@@ -123,32 +438,36 @@ def take_input_criteria_run(run: Callable[[str], str], *criteria: Callable[[str]
     return inp
 
 
-def filter_database(data: Dict[str, List[str]],
-                    *criteria: Callable[[str, str, str, str, str, str], bool]) -> Dict[str, List[str]]:
+def filter_database(data: Transcript,
+                    *criteria: Union[Predicate, np.ndarray, Callable[[str, str, str, str, str, str], bool]]) -> Transcript:
     """
-    Returns a database dictionary only with entries that satisfy the given criteria.
+    Returns a database only with entries that satisfy the given criteria.
+    Predicates are answered from the indexes of data and combined with boolean masks first,
+    and Callables are only called on the entries that are still selected.
 
     :param data: The database to filter from.
-    :param criteria: The Callable(s) to be called on each entry. This must take 6 strings as arguments,
+    :param criteria: Predicates (see equals(), one_of() and between()), boolean masks over the rows,
+                     or Callable(s) to be called on each entry. A Callable must take 6 strings as arguments,
                      each representing the keys SBJ, CRS, GRD, CRD, SEM, YER in the respective order.
                      It should return True if this entry should be included, False otherwise.
-    :return: The filtered database dictionary.
+    :return: The filtered database.
     """
-    result = {"SBJ": [], "CRS": [], "GRD": [], "CRD": [], "SEM": [], "YER": []}
-    for i in range(len(data["SBJ"])):
-        valid = True
-        for crit in criteria:
-            if not crit(data["SBJ"][i], data["CRS"][i], data["GRD"][i], data["CRD"][i], data["SEM"][i], data["YER"][i]):
-                valid = False
+    selected = np.ones(len(data), dtype=bool)
+    functions = []
+    for crit in criteria:
+        if isinstance(crit, Predicate):
+            selected &= crit.mask(data)
+        elif callable(crit):
+            functions.append(crit)
+        else:
+            selected &= crit
+    columns = [data[key] for key in Transcript.KEYS]
+    for i in np.flatnonzero(selected):
+        for crit in functions:
+            if not crit(*(column[i] for column in columns)):
+                selected[i] = False
                 break
-        if valid:
-            result["SBJ"].append(data["SBJ"][i])
-            result["CRS"].append(data["CRS"][i])
-            result["GRD"].append(data["GRD"][i])
-            result["CRD"].append(data["CRD"][i])
-            result["SEM"].append(data["SEM"][i])
-            result["YER"].append(data["YER"][i])
-    return result
+    return data.take(selected)
 
 
 def filter_builder(criteria_simplified: Callable[..., bool],
@@ -162,33 +481,18 @@ def filter_builder(criteria_simplified: Callable[..., bool],
                             in the filter Callable in the respective order for the positional argument.
     :return: The filtering function(s) to be passed into filter_database().
     """
-    order = ["SBJ", "CRS", "GRD", "CRD", "SEM", "YER"]
+    positions = [Transcript.KEYS.index(key) for key in keys_to_be_used]
 
-    def filter_function(SBJ: str, CRS: str, GRD: str, CRD: str, SEM: str, YER: str) -> bool:
-        original_arguments = [SBJ, CRS, GRD, CRD, SEM, YER]
-        arguments = []
-        for key in keys_to_be_used:
-            j = order.index(key)
-            arguments.append(original_arguments[j])
-        return criteria_simplified(*tuple(arguments))
+    def filter_function(*entry: str) -> bool:
+        return criteria_simplified(*[entry[j] for j in positions])
     return filter_function
 
 
-# Read file
-filename = "John_Transcript.CSV"
-file = open(filename, 'r')
-database = {"SBJ": [], "CRS": [], "GRD": [], "CRD": [], "SEM": [], "YER": []}
-for row in file.readlines()[1:]:
-    row_list = row.rstrip().split(',')
-    database["SBJ"].append(row_list[0])
-    database["CRS"].append(row_list[1])
-    database["GRD"].append(row_list[2])
-    database["CRD"].append(row_list[3])
-    database["SEM"].append(row_list[4])
-    database["YER"].append(row_list[5])
-file.close()
-
-course_count = len(database["SBJ"])
+# Read file(s)
+filenames = sys.argv[1:] or ["John_Transcript.CSV"]
+database = load_database(*filenames)
+
+course_count = len(database)
 print_credit_average(database)
 
 # Main loop
@@ -207,7 +511,7 @@ while True:
         print_credit_average(database)
     elif input_int == 2:
         # Take input to select subjects
-        subjects = get_subjects(database["SBJ"])
+        subjects = list(database.subjects)
         print("You have taken courses in the following subjects:")
         print(', '.join(subjects).rstrip())
         print("Please enter the subject code(s) to list out, separated by commas.")
@@ -215,15 +519,14 @@ while True:
                                              lambda inp: set(inp.split(',')).issubset(subjects))
         targets = user_input.split(',')
         # Filter and print
-        filtered_database = filter_database(database, filter_builder(lambda s: s in targets, "SBJ"))
+        filtered_database = filter_database(database, one_of("SBJ", targets))
         tabulate_database(filtered_database)
         print_credit_average(filtered_database)
     elif input_int == 3:
-        filtered_database = filter_database(database, filter_builder(lambda c: int(c[0]) >= 2, "CRS"))
+        filtered_database = filter_database(database, between("level", 2))
         tabulate_database(filtered_database)
         print_credit_average(filtered_database)
     elif input_int == 4:
-        simulated_database = deepcopy(database)
         print("Please enter the grade and credit of the course to be added, separated by a comma.")
         print("To enter multiple, separate each pair using a semicolon.")
         print("For example, if you want to add one course with the grade 80 and 3 credits and another with the",
@@ -243,13 +546,8 @@ while True:
             return True
         user_input = take_input_criteria_run(lambda inp: inp.replace(' ', ''), valid_input)
         to_add = [pair.split(',') for pair in user_input.split(';')]
-        for i in range(len(to_add)):
-            simulated_database["SBJ"].append("SIMU")
-            simulated_database["CRS"].append(str(i))
-            simulated_database["GRD"].append(to_add[i][0])
-            simulated_database["CRD"].append(to_add[i][1])
-            simulated_database["SEM"].append("NA")
-            simulated_database["YER"].append("NA")
+        simulated_database = database.extended([["SIMU", str(i), to_add[i][0], to_add[i][1], "NA", "NA"]
+                                                for i in range(len(to_add))])
         print_credit_average(simulated_database)
     elif input_int == 5:
         break
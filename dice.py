@@ -1,7 +1,109 @@
+import math
 import random as rand
+import re
+import sys
+import time
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from functools import lru_cache
+from statistics import NormalDist
+from typing import Union
 import sorter as srt
 
+try:
+    import resource   # not available on Windows, memory is then not reported
+except ImportError:
+    resource = None
+
+
+class progresshook(object):
+    def __init__(self, callback=None, interval:float=1.0, percent:float=None):
+        """
+        Reports the progress of long calculations and simulations through a callback,
+        at most once every (interval) seconds and/or every (percent) % of progress.
+        Pass hook=None to the dice functions instead to turn reporting off, which costs nothing.
+        :param callback: a function taking one dictionary with the keys
+        task, unit, done, total, percent, elapsed (s), rate (units/s), eta (s) and memory (peak MB, or None).
+        printprogress by default.
+        :param interval: the least number of seconds between reports, None to only report by percent.
+        :param percent: report each time this much more % is done, None to only report by time.
+        """
+        self.callback = callback or printprogress
+        self.interval = interval
+        self.percent = percent
+
+    def start(self, total:int, task:str, unit:str) -> "progressrun":
+        """
+        Starts tracking one run.
+        :param total: the amount of work in the run
+        :param task: the name of the run, such as "simulations"
+        :param unit: the name of one unit of work, such as "throws"
+        :return: the tracker to call update() on
+        """
+        return progressrun(self, total, task, unit)
+
+
+class progressrun(object):
+    def __init__(self, hook:progresshook, total:int, task:str, unit:str):
+        """
+        Tracks one run for a progresshook.
+        TO USERS: Please use progresshook.start() instead of initializing directly.
+        """
+        self.hook = hook
+        self.total = total
+        self.task = task
+        self.unit = unit
+        self.begin = time.perf_counter()
+        self.last = self.begin   # time of the last report
+        self.lastpercent = 0.0   # progress at the last report
+
+    def update(self, done:int):
+        """
+        Records that (done) units of the total are finished, reporting if enough time or progress has passed.
+        The final update is only reported if the run took long enough to report anything.
+        :param done: the amount of work finished so far
+        """
+        now = time.perf_counter()
+        percent = done / self.total * 100 if self.total else 100.0
+        due = self.interval_due(now) or (self.hook.percent is not None
+                                         and percent - self.lastpercent >= self.hook.percent)
+        if not due:
+            return
+        self.last = now
+        self.lastpercent = percent
+        elapsed = now - self.begin
+        rate = done / elapsed if elapsed > 0 else None
+        memory = None
+        if resource is not None:
+            # ru_maxrss is in bytes on macOS and in KB on Linux and the other Unixes
+            memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == "darwin" else 1024)
+        self.hook.callback({"task": self.task, "unit": self.unit, "done": done, "total": self.total,
+                            "percent": percent, "elapsed": elapsed, "rate": rate,
+                            "eta": (self.total - done) / rate if rate else None, "memory": memory})
+
+    def interval_due(self, now:float) -> bool:
+        return self.hook.interval is not None and now - self.last >= self.hook.interval
+
+
+def printprogress(info:dict):
+    """
+    Prints a progress report to the console, the default callback of progresshook.
+    :param info: the dictionary passed by progressrun.update()
+    """
+    line = str(round(info["percent"], 2)) + "% of the " + info["task"] + " completed"
+    if info["rate"] is not None:
+        line += ", " + str(round(info["rate"])) + " " + info["unit"] + "/s"
+    if info["eta"] is not None:
+        line += ", about " + str(round(info["eta"], 1)) + "s left"
+    if info["memory"] is not None:
+        line += ", " + str(round(info["memory"])) + " MB peak memory"
+    print(line)
+
+
+console = progresshook()   # the default hook, printing at most once a second
+
 
 def roll(face:int, dice:int=1) -> int:
   """
@@ -18,66 +120,473 @@ def roll(face:int, dice:int=1) -> int:
   return num
 
 
-def diceest(face:int, dice:int, trial:int) -> dict:
+def diceest(face:Union[int, str], dice:int, trial:int, seed:int=None, workers:int=1, chunk:int=2 ** 22, width:float=None,
+            confidence:float=0.95, hook:progresshook=console) -> dict:
     """
     Simulates dice throws to estimate the probability of getting each possible number in %.
-    Prints the progress to the console in percentage.
+    Reports the progress through hook, printing it to the console by default.
     Returns the result as a dictionary,
     where the keys are the numbers (int) and the values are the probabilities in % (float).
+    The throws are drawn as NumPy arrays a chunk at a time, so memory stays bounded for any number of trials.
     :param face: the number of faces of the dice. For example, enter 6 for D6's.
-    :param dice: the number of dice to roll.
+    Can also be a dice expression such as "4d6kh3", see diceexpr.
+    :param dice: the number of dice to roll, or the number of times to roll the expression.
     :param trial: the number of dice throws to be made for estimation. Higher the more accurate but takes longer.
+    When width is given, this is the most throws that will be made instead.
+    :param seed: the seed for the random number generator. Give the same seed to get the same result,
+    no matter the number of workers.
+    :param workers: the number of processes to split the simulation across.
+    :param chunk: the number of dice drawn at once, which bounds the memory used by each worker.
+    :param width: When given, keeps throwing until the confidence interval of every probability is at most
+    this wide, in percentage points, then prints the number of throws used and the width reached.
+    :param confidence: the confidence level of the interval used with width.
+    :param hook: the progresshook to report the progress to, None to not report.
     :return: a dictionary mapping the possible numbers to the probability of getting it
     """
 
-    count = {}
-    for n in range(dice, face * dice + 1):   # initialize key:value pairs
-        # min == # of dice * lowest number (1), max == # of dice * highest number
-        count[n] = 0
+    if width is None:
+        hist = simhist(face, dice, trial, seed, workers, chunk, hook)
+    else:
+        hist, trial, reached = adaptive(face, dice, width, disterror, trial, confidence, seed, workers, chunk, hook)
+        report(trial, reached, confidence, "percentage points")
 
-    for iteration in range(trial):   # repeated (trial) times
-        count[roll(face, dice)] += 1
-        print(str(iteration / trial * 100) + "% of the simulations completed")
+    print("\n------------------------------------------\n")
 
-    for number, occur in count.items():   # convert the counts to %
-        count[number] = occur / trial * 100
+    return histcount(hist, bounds(face, dice)[0], trial)
 
-    print("\n------------------------------------------\n")
+
+def histcount(hist:np.ndarray, low:int, trial:int) -> dict:
+    """
+    Converts a histogram of simulated sums into the dictionary of probabilities in %.
+    :param hist: an array where index i counts the throws summing to low + i
+    :param low: the lowest possible sum, such as the number of dice for plain dice.
+    :param trial: the number of throws made.
+    :return: a dictionary mapping the possible numbers to the probability of getting it
+    """
+
+    count = {}
+    for n in range(low, low + hist.size):   # convert the counts to %
+        count[n] = float(hist[n - low] / trial * 100)
 
     return count
 
 
-def dicecalc(face:int, dice:int) -> dict:
+def adaptive(face:Union[int, str], dice:int, width:float, error, maxtrial:int, confidence:float=0.95, seed:int=None,
+             workers:int=1, chunk:int=2 ** 22, hook:progresshook=console) -> tuple:
+    """
+    Simulates dice throws in batches until the confidence interval of the estimated quantity is narrow enough.
+    After each batch, the number of throws still needed is predicted from the width reached so far,
+    since the width shrinks with the square root of the number of throws.
+    :param face: the number of faces of the dice.
+    :param dice: the number of dice to roll.
+    :param width: the target width of the confidence interval.
+    :param error: a function (hist, trial, z) returning the width of the confidence interval,
+    such as disterror or the ones made by rangeerror() and meanerror().
+    :param maxtrial: the most throws to be made, even if the target is not reached.
+    :param confidence: the confidence level of the interval.
+    :param seed: the seed for the random number generator.
+    :param workers: the number of processes to split each batch across.
+    :param chunk: the number of dice drawn at once.
+    :param hook: the progresshook each batch reports its progress to, None to not report.
+    :return: (hist, trial, reached) where hist is as returned by simhist(), trial the number of throws made,
+    and reached the width of the confidence interval at the end
+    """
+
+    assert width > 0, "width must be positive"
+    assert 0 < confidence < 1, "confidence must be between 0 and 1"
+    assert maxtrial > 0, "maxtrial must be positive"
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    seq = np.random.SeedSequence(seed)
+    low, high = bounds(face, dice)
+    hist = np.zeros(high - low + 1, dtype=np.int64)
+    trial = 0
+    batch = min(maxtrial, 10000)   # first batch, enough for a rough estimate of the spread
+    while batch > 0:
+        hist += simhist(face, dice, batch, seq.spawn(1)[0], workers, chunk, hook)
+        trial += batch
+        reached = error(hist, trial, z)
+        if reached <= width:
+            break
+        needed = int(trial * (reached / width) ** 2 * 1.1) - trial   # 10% extra so the next batch is likely the last
+        batch = min(max(needed, 1000), maxtrial - trial)
+
+    return hist, trial, reached
+
+
+def report(trial:int, reached:float, confidence:float, unit:str):
+    """
+    Prints to the console the number of throws made and the width of the confidence interval reached.
+    :param trial: the number of throws made.
+    :param reached: the width of the confidence interval.
+    :param confidence: the confidence level of the interval.
+    :param unit: the unit of the width, or an empty string for none.
+    """
+
+    print("Made " + str(trial) + " throws; the " + str(confidence * 100) + "% confidence interval is "
+          + str(reached) + (" " + unit if unit else "") + " wide.")
+
+
+def propwidth(hits:np.ndarray, trial:int, z:float) -> np.ndarray:
+    """
+    Returns the width of the confidence interval of probabilities estimated from hit counts, in %.
+    Uses the Agresti-Coull adjustment so that outcomes never seen don't get a zero width.
+    :param hits: the number of throws that hit each outcome.
+    :param trial: the number of throws made.
+    :param z: the z-score of the confidence level.
+    :return: the widths in percentage points
+    """
+
+    n = trial + z ** 2
+    p = (hits + z ** 2 / 2) / n
+    return 2 * z * np.sqrt(p * (1 - p) / n) * 100
+
+
+def disterror(hist:np.ndarray, trial:int, z:float) -> float:
+    """
+    Returns the widest confidence interval among the probabilities of every sum, in percentage points.
+    """
+
+    return float(propwidth(hist, trial, z).max())
+
+
+def rangeerror(lower:int, upper:int, low:int):
+    """
+    Returns an error function for adaptive() measuring the confidence interval of the probability
+    of a sum between lower and upper (both inclusive), in percentage points.
+    low is the sum counted at index 0 of the histogram.
+    """
+
+    def error(hist, trial, z):
+        hits = hist[max(lower - low, 0):max(upper - low + 1, 0)].sum()
+        return float(propwidth(hits, trial, z))
+    return error
+
+
+def meanerror(low:int):
+    """
+    Returns an error function for adaptive() measuring the confidence interval of the expected value.
+    low is the sum counted at index 0 of the histogram.
+    """
+
+    def error(hist, trial, z):
+        values = np.arange(low, low + hist.size)
+        mean = (values * hist).sum() / trial
+        var = (hist * (values - mean) ** 2).sum() / max(trial - 1, 1)
+        return float(2 * z * np.sqrt(var / trial))
+    return error
+
+
+def simhist(face:Union[int, str], dice:int, trial:int, seed:int=None, workers:int=1, chunk:int=2 ** 22,
+            hook:progresshook=console) -> np.ndarray:
+    """
+    Simulates dice throws and returns how many times each sum came up.
+    The trials are cut into chunks, and each chunk gets its own random stream spawned from the seed.
+    How the chunks are cut does not depend on workers, and the partial histograms are added as integers,
+    so the result for a given seed is the same for any number of workers.
+    Reports the progress through hook after each chunk.
+    :param face: the number of faces of the dice, or a dice expression.
+    :param dice: the number of dice to roll.
+    :param trial: the number of dice throws to be made.
+    :param seed: the seed for the random number generator, or a SeedSequence to spawn the streams from.
+    :param workers: the number of processes to split the chunks across. 1 runs in this process.
+    :param chunk: the number of dice drawn at once.
+    :param hook: the progresshook to report the progress to, None to not report.
+    :return: an array where index i counts the throws summing to bounds(face, dice)[0] + i
+    """
+
+    assert workers >= 1, "workers must be positive"
+    assert dice >= 0, "dice can't be negative"
+    step = max(1, chunk // max(1, dice * pool(face).width))   # throws per chunk
+    sizes = [min(step, trial - start) for start in range(0, trial, step)]
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    streams = seed.spawn(len(sizes))
+    low, high = bounds(face, dice)
+    hist = np.zeros(high - low + 1, dtype=np.int64)
+
+    run = hook.start(trial, "simulations", "throws") if hook is not None else None
+
+    def merge(partials):
+        done = 0
+        for n, part in zip(sizes, partials):
+            hist[:] += part
+            done += n
+            if run is not None:
+                run.update(done)
+
+    if workers == 1:
+        merge(simchunk(face, dice, n, s) for n, s in zip(sizes, streams))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            merge(executor.map(simchunk, [face] * len(sizes), [dice] * len(sizes), sizes, streams))
+
+    return hist
+
+
+def simchunk(face:Union[int, str], dice:int, n:int, stream:np.random.SeedSequence) -> np.ndarray:
+    """
+    Simulates one chunk of dice throws and returns the partial histogram of the sums.
+    :param face: the number of faces of the dice, or a dice expression.
+    :param dice: the number of dice to roll.
+    :param n: the number of throws in this chunk.
+    :param stream: the seed sequence of this chunk's random stream.
+    :return: an array where index i counts the throws summing to bounds(face, dice)[0] + i
+    """
+
+    rng = np.random.default_rng(stream)
+    low, high = bounds(face, dice)
+    sums = pool(face).sample(n * dice, rng).reshape(n, dice).sum(axis=1)
+    return np.bincount(sums - low, minlength=high - low + 1)
+
+
+def dicecalc(face:Union[int, str], dice:int, mode:str="float", hook:progresshook=console) -> dict:
     """
     Calculates the probability of getting each possible number by rolling dice, in %.
-    Prints the progress to the console in percentage.
     Returns the result as a dictionary,
     where the keys are the numbers (int) and the values are the probabilities in % (float).
+    The distribution of the sum is the single-die distribution convolved with itself (dice) times,
+    done by exponentiation by squaring, so 100D100 takes milliseconds.
+    Results are kept in distcache, so asking again for the same dice costs nothing.
     :param face: the number of faces of the dice. For example, enter 6 for D6's.
-    :param dice: the number of dice to roll.
+    Can also be a dice expression such as "3d6+2d8+5", see diceexpr.
+    :param dice: the number of dice to roll, or the number of times to roll the expression.
+    :param mode: "float" for the probabilities in % as floats.
+    The other modes are exact and only work with a plain number of faces:
+    "count" for the number of outcomes (int) giving each number, out of face ** dice,
+    "fraction" for the probabilities in % as Fractions,
+    "log" for the natural logarithm of each probability (as a fraction of 1, not in %), which stays accurate
+    for tail probabilities far too small for a float.
+    :param hook: the progresshook to report the progress of long calculations to, None to not report.
     :return: a dictionary mapping the possible numbers to the probability of getting it
     """
 
-    grid = np.zeros([face for i in range(dice)], dtype=int)   # (dice)-D grid with length (face), the result of the list comprehension is [6, 6, 6] for 3D6
-    i = np.zeros(dice, dtype=int)   # the index of each dimension as a 1D array, array used for array arithmetic below
-    track = 0   # used to track progress (to be printed as %)
-    while (i < face - 1).any():   # repeated until i == [face-1 face-1]
-        grid[tuple(i)] = (i + 1).sum()
-        sat = -1   # checks the index of the last dimension, working upward one by one if "saturated"
-        while i[sat] == face - 1:
-            i[sat] = 0
-            sat -= 1
-        i[sat] += 1   # proceed to the next box
-        track += 1
-        print(str(track / grid.size * 100) + "% of the calculation completed.")
-    grid[tuple(i)] = (i + 1).sum()   # the loop terminates just before the last box is filled in, so do this manually
-
-    print("\n-------------------------------------------------\n")
-    count = {}
-    for n in range(dice, face * dice + 1):   # min == # of dice * lowest number (1), max == # of dice * highest number
-        count[n] = grid[grid == n].size / grid.size * 100
+    assert mode in ("float", "count", "fraction", "log"), "mode must be float, count, fraction or log"
+    if mode == "float":
+        return distcache.get(face, dice, hook).todict()
+
+    assert type(face) is int, "exact modes need a plain number of faces"
+    count = exactcount(face, dice, hook)
+    total = face ** dice
+    if mode == "count":
+        values = count
+    elif mode == "fraction":
+        values = [Fraction(c * 100, total) for c in count]
+    else:
+        logtotal = dice * math.log(face)
+        values = [math.log(c) - logtotal for c in count]   # math.log takes ints of any size
+    return dict(zip(range(dice, face * dice + 1), values))
 
-    return count
+
+def exactcount(face:int, dice:int, hook:progresshook=None) -> list:
+    """
+    Counts, with Python integers, the outcomes of rolling (dice) (face)-sided dice that give each sum.
+    The counts are the coefficients of (1 + x + ... + x^(face-1)) ** dice = (1 - x^face) ** dice / (1 - x) ** dice.
+    The numerator only has (dice + 1) binomial terms, and dividing by (1 - x) is a running sum,
+    so this takes (dice) running sums over an object array instead of any multiplication.
+    :param face: the number of faces of the dice.
+    :param dice: the number of dice to roll.
+    :param hook: the progresshook to report each running sum to, None to not report.
+    :return: a list where index i is the number of outcomes summing to dice + i
+    """
+
+    assert face >= 1 and dice >= 0, "face must be positive and dice can't be negative"
+    size = face * dice - dice + 1
+    count = np.zeros(size, dtype=object)   # object arrays hold Python ints, which never overflow
+    for k in range(min(dice, (size - 1) // face) + 1):
+        count[k * face] = (-1) ** k * math.comb(dice, k)
+    run = hook.start(dice, "calculation", "steps") if hook is not None else None
+    for i in range(dice):
+        count = np.cumsum(count)
+        if run is not None:
+            run.update(i + 1)
+    return count.tolist()
+
+
+def calcprob(face:Union[int, str], dice:int, trial:int=1000000, hook:progresshook=None) -> np.ndarray:
+    """
+    Calculates the probability of getting each possible number by rolling dice, in %.
+    Expressions keeping or dropping dice can't be convolved, so those are estimated
+    from (trial) simulated throws instead, with a fixed seed so the result is repeatable.
+    :param face: the number of faces of the dice, or a dice expression.
+    :param dice: the number of dice to roll.
+    :param trial: the number of throws used when the expression has to be simulated.
+    :param hook: the progresshook to report the progress to, None to not report.
+    :return: an array where index i is the probability of getting bounds(face, dice)[0] + i
+    """
+
+    if type(face) is str:
+        expr = pool(face)
+        if expr.exact:
+            return convpower(expr.prob(), dice, np.convolve, hook) * 100
+        print("Keeping or dropping dice can't be calculated exactly, estimating from " + str(trial) + " throws instead.")
+        return simhist(face, dice, trial, 0, hook=hook) / trial * 100
+
+    total = face ** dice   # the number of equally likely outcomes
+    if total < 2 ** 63:
+        # exact outcome counts still fit in int64
+        count = convpower(np.ones(face, dtype=np.int64), dice, np.convolve, hook)
+        return count / total * 100
+    else:
+        # direct convolution keeps the relative accuracy of the tiny tail probabilities, which an FFT would round to noise
+        return convpower(np.full(face, 1 / face), dice, np.convolve, hook) * 100
+
+
+class distribution(object):
+    def __init__(self, face:Union[int, str], dice:int, prob:np.ndarray):
+        """
+        The calculated distribution of a dice roll, with its cumulative sums so that
+        range probabilities, quantiles and the expected value are looked up instead of recomputed.
+        TO USERS: Please use distcache.get() instead of initializing directly.
+        """
+        self.face = face
+        self.dice = dice
+        self.low = bounds(face, dice)[0]   # the lowest possible number
+        self.prob = prob   # prob[i] is the probability of getting low + i, in %
+        self.cdf = np.concatenate(([0.0], np.cumsum(prob)))   # cdf[i] is the probability of getting less than low + i
+        self.mean = float((np.arange(self.low, self.low + prob.size) * prob).sum() / 100)
+
+    def todict(self) -> dict:
+        """
+        :return: a dictionary mapping the possible numbers to the probability of getting it, in %
+        """
+        return dict(zip(range(self.low, self.low + self.prob.size), self.prob.tolist()))
+
+    def range(self, lower:int, upper:int) -> float:
+        """
+        Returns the probability of getting a number between lower and upper (both inclusive), in %.
+        :param lower: the lower bound of the range
+        :param upper: the upper bound of the range
+        :return: the probability in %
+        """
+        lo = min(max(lower - self.low, 0), self.prob.size)
+        hi = min(max(upper - self.low + 1, 0), self.prob.size)
+        return float(self.cdf[hi] - self.cdf[lo]) if hi > lo else 0.0
+
+    def quantile(self, q:float) -> int:
+        """
+        Returns the smallest number that is rolled at or below with probability at least q.
+        :param q: the probability between 0 and 1
+        :return: the number
+        """
+        assert 0 <= q <= 1, "q must be between 0 and 1"
+        i = int(np.searchsorted(self.cdf[1:], q * self.cdf[-1]))
+        return self.low + min(i, self.prob.size - 1)
+
+
+class lrucache(object):
+    def __init__(self, maxsize:int=128, path:str=None):
+        """
+        Least-recently-used cache of calculated distributions, keyed by (face, dice).
+        :param maxsize: the most distributions to keep, the least recently used one is dropped first
+        :param path: optional .npz file to load the cache from; save() writes back to it
+        """
+        assert maxsize >= 1, "maxsize must be positive"
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        if path is not None:
+            try:
+                self.load(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, face:Union[int, str], dice:int, hook:progresshook=None) -> distribution:
+        """
+        Returns the distribution of the dice roll, calculating it only if it is not cached.
+        :param face: the number of faces of the dice, or a dice expression.
+        :param dice: the number of dice to roll.
+        :param hook: the progresshook to report the calculation to, None to not report.
+        :return: the distribution
+        """
+        if type(face) is str:
+            face = pool(face).text   # so that differently spaced expressions share an entry
+        key = (face, dice)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        entry = distribution(face, dice, calcprob(face, dice, hook=hook))
+        self.entries[key] = entry
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+
+    def save(self, path:str=None):
+        """
+        Writes the cached distributions to a .npz file.
+        :param path: the file to write, the path given at creation by default
+        """
+        path = path or self.path
+        assert path is not None, "no path to save to"
+        np.savez_compressed(path, **{cachename(f, d): e.prob for (f, d), e in self.entries.items()})
+
+    def load(self, path:str):
+        """
+        Adds the distributions saved in a .npz file to the cache.
+        Entries whose names were not written by save() are skipped, as they can't be told apart reliably.
+        :param path: the file to read
+        """
+        with np.load(path) as data:
+            for name in data.files:
+                key = cachekey(name)
+                if key is None:
+                    continue
+                face, dice = key
+                self.entries[key] = distribution(face, dice, data[name])
+                if len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+
+
+def cachename(face:Union[int, str], dice:int) -> str:
+    """
+    Returns the name a cached distribution is saved under: "6D3" for 3D6,
+    and "expr" + expression + "D" + dice for an expression, so that the expression "6" can't be read back as 1D6.
+    """
+    return ("" if type(face) is int else "expr") + str(face) + "D" + str(dice)
+
+
+def cachekey(name:str) -> Union[tuple, None]:
+    """
+    Returns the (face, dice) key of a name written by cachename(), or None if it is not one.
+    """
+    match = re.fullmatch(r"(\d+|expr.+)D(\d+)", name)   # expressions are stored in lowercase, so the last D is the separator
+    if match is None:
+        return None
+    face = match.group(1)
+    return (face[4:] if face.startswith("expr") else int(face)), int(match.group(2))
+
+
+distcache = lrucache()
+
+
+def convpower(dist:np.ndarray, n:int, conv, hook:progresshook=None) -> np.ndarray:
+    """
+    Convolves a distribution with itself n times by exponentiation by squaring,
+    which takes O(log n) convolutions instead of n.
+    :param dist: the distribution (counts or probabilities) of a single die, index 0 being its lowest number
+    :param n: the number of copies to convolve, 0 gives [1] (no dice always sum to 0)
+    :param conv: the convolution function to use, such as np.convolve
+    :param hook: the progresshook to report each squaring to, None to not report.
+    :return: the distribution of the sum of n dice, index 0 being the lowest possible sum
+    """
+
+    assert n >= 0, "dice can't be negative"
+    result = None
+    power = dist   # dist convolved with itself 1, 2, 4, 8... times
+    run = hook.start(n.bit_length(), "calculation", "steps") if hook is not None else None
+    step = 0
+    while True:
+        if n % 2 == 1:
+            result = power if result is None else conv(result, power)
+        n //= 2
+        step += 1
+        if run is not None:
+            run.update(step)
+        if n == 0:
+            return result if result is not None else np.ones(1, dtype=dist.dtype)
+        power = conv(power, power)
 
 
 def printresult(ascending:bool, count:dict, limit:int, bynum:bool):
@@ -92,8 +601,8 @@ def printresult(ascending:bool, count:dict, limit:int, bynum:bool):
     """
 
     if type(limit) is int:
-        csorted = srt.sortdict(count, descend=not ascending)   # first sort by probability
-        csorted = srt.sortdict(dict(csorted[0:limit]), bykey=bynum, descend=not ascending)    # slice to length, then (potentially) sort by number
+        # select the top probabilities without sorting the rest, then (potentially) sort them by number
+        csorted = srt.topk(count, limit, descend=not ascending, orderbykey=bynum)
 
     else:
         csorted = srt.sortdict(count, descend=not ascending, bykey=bynum)
@@ -102,98 +611,339 @@ def printresult(ascending:bool, count:dict, limit:int, bynum:bool):
         print(str(item[0]) + ": " + str(item[1]) + "%")
 
 
-def est(face:int, dice:int, trial:int, limit:int=None, ascending:bool=False, bynum:bool=False):
+def est(face:Union[int, str], dice:int, trial:int, limit:int=None, ascending:bool=False, bynum:bool=False, seed:int=None,
+        workers:int=1, hook:progresshook=console):
     """
     Simulates dice throws to estimate the probability of getting each possible number in %.
     Prints the result to the console in descending order based on the probability.
     :param face: the number of faces of the dice. For example, enter 6 for D6's.
-    :param dice: the number of dice to roll.
+    Can also be a dice expression such as "3d6+2d8+5", see diceexpr.
+    :param dice: the number of dice to roll, or the number of times to roll the expression.
     :param trial: the number of dice throws to be made for estimation. Higher the more accurate but takes longer.
     :param limit: When set to a positive integer, it will only display that number of the top probabilities.
     If ascending is also set to True, it will only print the lowest probabilities.
     :param ascending: When set to True, prints the result in ascending order instead.
     :param bynum: When set to True, sorts the result by the number instead of the probability.
     When used with limit, the items to be displayed are still determined by the probability, not by the number.
+    :param seed: the seed for the random number generator. Give the same seed to get the same result.
+    :param workers: the number of processes to split the simulation across.
+    :param hook: the progresshook to report the progress to, None to not report.
     """
     if limit is not None:
       assert limit >= 1, "limit must be positive"
   
-    count = diceest(face, dice, trial)
+    count = diceest(face, dice, trial, seed, workers, hook=hook)
 
-    print("Having thrown " + str(dice) + "D" + str(face) + " " + str(trial) + " times, here are the estimated")
+    print("Having thrown " + label(face, dice) + " " + str(trial) + " times, here are the estimated")
     print("probabilities of getting each number:\n")
 
     printresult(ascending, count, limit, bynum)
 
 
-def calc(face:int, dice:int, limit:int=None, ascending:bool=False, bynum:bool=False):
+def calc(face:Union[int, str], dice:int, limit:int=None, ascending:bool=False, bynum:bool=False,
+         hook:progresshook=console):
     """
     Calculates the probability of getting each possible number by rolling dice, in %.
     Prints the result to the console in descending order based on the probability.
     :param face: the number of faces of the dice. For example, enter 6 for D6's.
-    :param dice: the number of dice to roll.
+    Can also be a dice expression such as "3d6+2d8+5", see diceexpr.
+    :param dice: the number of dice to roll, or the number of times to roll the expression.
     :param limit: When set to a positive integer, it will only display that number of the top probabilities.
     If ascending is also set to True, it will only print the lowest probabilities.
     :param ascending: When set to True, prints the result in ascending order instead.
     :param bynum: When set to True, sorts the result by the number instead of the probability.
     When used with limit, the items to be displayed are still determined by the probability, not by the number.
+    :param hook: the progresshook to report the progress of long calculations to, None to not report.
     """
 
     if limit is not None:
       assert limit >= 1, "limit must be positive"
       
-    count = dicecalc(face, dice)
+    count = dicecalc(face, dice, hook=hook)
 
-    print("Here are the probabilities of getting each number when throwing " + str(dice) + "D" + str(face) + ":")
+    print("Here are the probabilities of getting each number when throwing " + label(face, dice) + ":")
 
     printresult(ascending, count, limit, bynum)
 
 
-def rangechance(face:int, dice:int, lower:int, upper:int, est:bool=False, trial:int=1000000):
+def rangechance(face:Union[int, str], dice:int, lower:int, upper:int, est:bool=False, trial:int=1000000, seed:int=None,
+                workers:int=1, width:float=None, confidence:float=0.95, hook:progresshook=console):
     """
     Prints to the console the probability of getting a number between the lower and the upper bound from the dice roll.
     :param face: the number of faces of the dice. For example, enter 6 for D6's.
-    :param dice: the number of dice to roll.
+    Can also be a dice expression such as "3d6+2d8+5", see diceexpr.
+    :param dice: the number of dice to roll, or the number of times to roll the expression.
     :param lower: the lower bound (inclusive) of the range
     :param upper: the upper bound (inclusive) of the range
     :param est: When set to True, use estimated values from simulations instead of calculated ones.
     Intended for throws that are too big for to be calculated.
     :param trial: the number of dice throws to be made for estimation. Higher the more accurate but takes longer.
     Only used when est == True. The default is one million throws.
+    :param seed: the seed for the random number generator. Only used when est == True.
+    :param workers: the number of processes to split the simulation across. Only used when est == True.
+    :param width: When given with est == True, keeps throwing until the confidence interval of the probability
+    is at most this wide, in percentage points. trial is then the most throws that will be made.
+    :param confidence: the confidence level of the interval used with width.
+    :param hook: the progresshook to report the progress to, None to not report.
     """
       
+    if est and width is not None:
+        low = bounds(face, dice)[0]
+        hist, trial, reached = adaptive(face, dice, width, rangeerror(lower, upper, low), trial, confidence,
+                                        seed, workers, hook=hook)
+        report(trial, reached, confidence, "percentage points")
+        count = histcount(hist, low, trial)
+    elif est:
+        count = diceest(face, dice, trial, seed, workers, hook=hook)
+
     if est:
-        count = diceest(face, dice, trial)
+        prob = sum(v for num, v in count.items() if lower <= num <= upper)
     else:
-        count = dicecalc(face, dice)
+        prob = distcache.get(face, dice, hook).range(lower, upper)
 
-    for num in count.copy().keys():   # remove all numbers not in the range
-        if num < lower or num > upper:
-            del count[num]
-
-    prob = sum(count.values())
-
-    print("The probability of getting a number between " + str(lower) + " and " + str(upper) + " by throwing " + str(dice) + "D" + str(face) + " is:")
+    print("The probability of getting a number between " + str(lower) + " and " + str(upper) + " by throwing " + label(face, dice) + " is:")
     print(str(prob) + "%")
 
 
-def expect(face:int, dice:int, est:bool=False, trial:int=1000000):
+def expect(face:Union[int, str], dice:int, est:bool=False, trial:int=1000000, seed:int=None, workers:int=1, width:float=None,
+           confidence:float=0.95, hook:progresshook=console):
   """Prints to the console the expected value of the dice roll.
   :param face: the number of faces of the dice. For example, enter 6 for D6's.
-  :param dice: the number of dice to roll.
+  Can also be a dice expression such as "3d6+2d8+5", see diceexpr.
+  :param dice: the number of dice to roll, or the number of times to roll the expression.
   :param est: When set to True, use estimated values from simulations instead of calculated ones.
   Intended for throws that are too big for to be calculated.
   :param trial: the number of dice throws to be made for estimation. Higher the more accurate but takes longer.
-  Only used when est == True. The default is one million throws."""
+  Only used when est == True. The default is one million throws.
+  :param seed: the seed for the random number generator. Only used when est == True.
+  :param workers: the number of processes to split the simulation across. Only used when est == True.
+  :param width: When given with est == True, keeps throwing until the confidence interval of the expected value
+  is at most this wide. trial is then the most throws that will be made.
+  :param confidence: the confidence level of the interval used with width.
+  :param hook: the progresshook to report the progress to, None to not report."""
+
+  if est and width is not None:
+    low = bounds(face, dice)[0]
+    hist, trial, reached = adaptive(face, dice, width, meanerror(low), trial, confidence, seed, workers, hook=hook)
+    report(trial, reached, confidence, "")
+    count = histcount(hist, low, trial)
+  elif est:
+    count = diceest(face, dice, trial, seed, workers, hook=hook)
 
   if est:
-    count = diceest(face, dice, trial)
+    value = 0   # this is the expected value
+    for num, prob in count.items():
+      value += num * (prob/100)
   else:
-    count = dicecalc(face, dice)
-    
-  value = 0   # this is the expected value
-  for num, prob in count.items():
-    value += num * (prob/100)
+    value = distcache.get(face, dice, hook).mean
 
-  print("The expected value of throwing " + str(dice) + "D" + str(face) + " is:")
+  print("The expected value of throwing " + label(face, dice) + " is:")
   print(value)
+
+
+explode_cutoff = 1e-12   # exploding dice stop once the chance of exploding again is below this
+
+
+class diceexpr(object):
+    def __init__(self, text:str):
+        """
+        A dice expression such as "3d6+2d8+5", made of terms added or subtracted together.
+        Each term is a whole number or NdF (N dice with F faces, N defaults to 1, d% is d100),
+        optionally followed by modifiers:
+        khK / klK keep the K highest / lowest dice (kK is khK), dhK / dlK drop the K highest / lowest dice,
+        ! explodes (a die showing F is rolled again and added), rR rerolls once any die showing R or less.
+        Exploding dice are cut off once the chance of going on is below explode_cutoff.
+        TO USERS: Please use pool() instead of initializing directly.
+        """
+        self.text = text.replace(" ", "").lower()
+        assert self.text, "empty dice expression"
+        self.terms = []   # (sign, count, face, keep, explode, reroll), face is None for a whole number
+        pos = 0
+        for sign, body in re.findall(r"([+-]?)([^+-]+)", self.text):
+            pos += len(sign) + len(body)
+            sign = -1 if sign == "-" else 1
+            if body.isdigit():
+                self.terms.append((sign, int(body), None, None, False, 0))
+                continue
+            match = re.fullmatch(r"(\d*)d(\d+|%)((?:k[hl]?\d+|d[hl]\d+|!|r\d+)*)", body)
+            assert match, "invalid dice term '" + body + "'"
+            count = int(match.group(1) or 1)
+            face = 100 if match.group(2) == "%" else int(match.group(2))
+            assert count >= 1 and face >= 1, "dice and faces must be positive in '" + body + "'"
+            keep = None   # (True for highest / False for lowest, number of dice kept)
+            explode = False
+            reroll = 0
+            for mod in re.findall(r"k[hl]?\d+|d[hl]\d+|!|r\d+", match.group(3)):
+                if mod == "!":
+                    assert face >= 2, "a die with one face can't explode"
+                    explode = True
+                elif mod[0] == "r":
+                    reroll = int(mod[1:])
+                    assert reroll < face, "can't reroll every face in '" + body + "'"
+                else:
+                    assert keep is None, "only one keep/drop per term in '" + body + "'"
+                    n = int(mod.lstrip("kdhl"))
+                    highest = mod[1] != "l"
+                    if mod[0] == "d":   # dropping the highest is keeping the lowest
+                        n = count - n
+                        highest = not highest
+                    assert 1 <= n <= count, "must keep between 1 and " + str(count) + " dice in '" + body + "'"
+                    keep = (highest, n)
+            self.terms.append((sign, count, face, keep, explode, reroll))
+        assert pos == len(self.text), "invalid dice expression '" + text + "'"
+
+        self.exact = all(t[3] is None for t in self.terms)   # keep/drop terms can only be simulated
+        self.width = sum(t[1] for t in self.terms if t[2] is not None) or 1   # dice drawn per roll, at least
+        self.low = 0
+        self.high = 0
+        for sign, count, face, keep, explode, reroll in self.terms:
+            if face is None:
+                lo = hi = count
+            else:
+                n = count if keep is None else keep[1]
+                lo = n
+                hi = n * face * ((explodes(face, reroll) if explode else 0) + 1)
+            if sign == 1:
+                self.low += lo
+                self.high += hi
+            else:
+                self.low -= hi
+                self.high -= lo
+
+    def __repr__(self):
+        return self.text
+
+    def prob(self) -> np.ndarray:
+        """
+        Returns the exact distribution of the expression by convolving its terms.
+        Only for expressions without keep/drop.
+        :return: an array where index i is the probability (as a fraction) of getting low + i
+        """
+
+        assert self.exact, "keep/drop can't be calculated exactly"
+        result = np.ones(1)
+        for sign, count, face, keep, explode, reroll in self.terms:
+            if face is None:
+                continue   # whole numbers only shift the range, which low already accounts for
+            term = convpower(dieprob(face, explode, reroll), count, np.convolve)
+            if sign == -1:
+                term = term[::-1]
+            result = np.convolve(result, term)
+        return result
+
+    def sample(self, n:int, rng:np.random.Generator) -> np.ndarray:
+        """
+        Simulates rolling the expression n times.
+        :param n: the number of rolls
+        :param rng: the random number generator to draw from
+        :return: an array of the n results
+        """
+
+        total = np.zeros(n, dtype=np.int64)
+        for sign, count, face, keep, explode, reroll in self.terms:
+            if face is None:
+                total += sign * count
+                continue
+            rolls = dieroll(face, explode, reroll, n * count, rng).reshape(n, count)
+            if keep is not None:
+                rolls = np.sort(rolls, axis=1)
+                rolls = rolls[:, count - keep[1]:] if keep[0] else rolls[:, :keep[1]]
+            total += sign * rolls.sum(axis=1)
+        return total
+
+
+@lru_cache(maxsize=256)
+def pool(face:Union[int, str]) -> diceexpr:
+    """
+    Returns the parsed dice expression for face, where a number of faces is treated as "1dF".
+    :param face: the number of faces of a die, or a dice expression
+    :return: the parsed expression
+    """
+    if type(face) is str:
+        return diceexpr(face)
+    assert face >= 1, "face must be positive"
+    return diceexpr("1d" + str(face))
+
+
+def bounds(face:Union[int, str], dice:int) -> tuple:
+    """
+    Returns the lowest and highest possible numbers when rolling (dice) of the given dice or expression.
+    :param face: the number of faces of the dice, or a dice expression
+    :param dice: the number of dice to roll, or the number of times to roll the expression
+    :return: (lowest, highest)
+    """
+    expr = pool(face)
+    return expr.low * dice, expr.high * dice
+
+
+def label(face:Union[int, str], dice:int) -> str:
+    """
+    Returns the name of the roll for printing, such as "3D6" or "2 x (4d6kh3)".
+    """
+    if type(face) is str:
+        return pool(face).text if dice == 1 else str(dice) + " x (" + pool(face).text + ")"
+    return str(dice) + "D" + str(face)
+
+
+def explodes(face:int, reroll:int) -> int:
+    """
+    Returns how many times an exploding die may explode before being cut off.
+    :param face: the number of faces of the die, at least 2
+    :param reroll: dice showing this or less are rerolled once, 0 for none
+    :return: the most explosions
+    """
+    p = (reroll / face + 1) / face   # chance of showing the highest face, rerolls included
+    return int(np.ceil(np.log(explode_cutoff) / np.log(p)))
+
+
+def dieprob(face:int, explode:bool, reroll:int) -> np.ndarray:
+    """
+    Returns the exact distribution of a single die.
+    :param face: the number of faces of the die
+    :param explode: when set to True, the die explodes on its highest face
+    :param reroll: dice showing this or less are rerolled once, 0 for none
+    :return: an array where index i is the probability of getting 1 + i
+    """
+    once = np.full(face, 1 / face)
+    once[:reroll] = 0
+    once += reroll / face / face   # a rerolled die lands on every face equally
+    if not explode:
+        return once
+    k = explodes(face, reroll)
+    result = np.zeros(face * (k + 1))
+    p = 1.0   # chance of getting to the current explosion
+    for i in range(k + 1):
+        stop = once[:-1] if i < k else once   # the last explosion is cut off, so its highest face stops too
+        result[i * face:i * face + stop.size] = p * stop
+        p *= once[-1]
+    return result
+
+
+def dieroll(face:int, explode:bool, reroll:int, n:int, rng:np.random.Generator) -> np.ndarray:
+    """
+    Simulates rolling a single die n times.
+    :param face: the number of faces of the die
+    :param explode: when set to True, the die explodes on its highest face
+    :param reroll: dice showing this or less are rerolled once, 0 for none
+    :param n: the number of rolls
+    :param rng: the random number generator to draw from
+    :return: an array of the n results
+    """
+
+    def once(size):
+        r = rng.integers(1, face, size=size, endpoint=True)
+        if reroll:
+            low = r <= reroll
+            r[low] = rng.integers(1, face, size=low.sum(), endpoint=True)
+        return r
+
+    result = once(n)
+    if explode:
+        live = np.flatnonzero(result == face)   # dice still exploding
+        for i in range(explodes(face, reroll)):
+            if live.size == 0:
+                break
+            extra = once(live.size)
+            result[live] += extra
+            live = live[extra == face]
+    return result
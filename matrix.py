@@ -1,4 +1,9 @@
+import hashlib
+import math
+import os
+import time
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 
 
@@ -8,8 +13,40 @@ class matrixer(object):
     TO USERS: Please use ienter() or enter() instead of initializing directly.
     """
     self.matrix = mx
+
+  @property
+  def matrix(self) -> np.ndarray:
+    return self._matrix
+
+  @matrix.setter
+  def matrix(self, mx:np.ndarray):
+    self._matrix = mx
     self.dim = mx.shape
     self.dtype = mx.dtype
+    self.invalidate()
+
+  def invalidate(self):
+    """
+    Drops the cached factorization.
+    Changes to self.matrix are detected automatically by factor(), so this is only needed
+    to free the memory held by the cache.
+    """
+    self._factor = None
+    self._stamp = None
+
+  def factor(self) -> "factorization":
+    """
+    Returns the cached factorization of the matrix, computing a new one if the matrix
+    has been replaced or changed in place since the last call.
+    Checking for changes reads the matrix once, which is O(n^2).
+
+    :return: the factorization object for the current content of the matrix
+    """
+    stamp = fingerprint(self._matrix)
+    if self._factor is None or stamp != self._stamp:
+      self._factor = factorization(self._matrix)
+      self._stamp = stamp
+    return self._factor
 
   def __repr__(self):
     mx = self.matrix
@@ -20,54 +57,385 @@ class matrixer(object):
     return str(mx)
 
   def __add__(self, b):
-    assert type(b) is matrixer, "addition must be between matrices"
-    return matrixer(np.add(self.matrix, b.matrix))
+    return self.add(b)
+
+  def __sub__(self, b):
+    return self.sub(b)
 
   def __mul__(self, b):
-    assert type(b) in (matrixer, int, float), "can only multiply number or matrix"
+    return self.mul(b)
+
+  def __matmul__(self, b):
+    assert type(b) is matrixer, "matrix multiplication must be between matrices"
+    return self.mul(b)
+
+  def __iadd__(self, b):
+    if self._fits(b):
+      return self.add(b, out=self)
+    self.matrix = self.add(b).matrix
+    return self
+
+  def __isub__(self, b):
+    if self._fits(b):
+      return self.sub(b, out=self)
+    self.matrix = self.sub(b).matrix
+    return self
+
+  def __imul__(self, b):
     if type(b) is matrixer:
-      return matrixer(np.dot(self.matrix, b.matrix))
-    else:
-      return matrixer(np.dot(self.matrix, b))
+      # the product may change shape and can't overwrite its own input, so a new array is unavoidable
+      self.matrix = np.dot(self.matrix, b.matrix)
+      return self
+    if self._fits(b):
+      return self.mul(b, out=self)
+    self.matrix = self.mul(b).matrix
+    return self
 
-  def __sub__(self, b):
+  def _fits(self, b) -> bool:
+    """
+    Returns whether the elementwise result of self and b can be written into self's own array,
+    that is it keeps the shape of self and its type casts to self's (an int matrix times 0.5 does not).
+    """
+    other = b.matrix if type(b) is matrixer else b
+    return (np.can_cast(np.result_type(self.matrix, other), self.dtype, "same_kind")
+            and np.broadcast_shapes(self.dim, np.shape(other)) == self.dim)
+
+  def add(self, b, out:"matrixer"=None) -> "matrixer":
+    """
+    Returns self + b. When out is given, the sum is written into its array and out is returned,
+    so nothing new is allocated.
+
+    :param b: the matrix to be added
+    :param out: optional matrix of the right size to hold the result, may be self or b
+    :return: the sum
+    """
+    assert type(b) is matrixer, "addition must be between matrices"
+    return self._ufunc(np.add, b.matrix, out)
+
+  def sub(self, b, out:"matrixer"=None) -> "matrixer":
+    """
+    Returns self - b in a single pass. When out is given, the difference is written into its array
+    and out is returned, so nothing new is allocated.
+
+    :param b: the matrix to be subtracted
+    :param out: optional matrix of the right size to hold the result, may be self or b
+    :return: the difference
+    """
     assert type(b) is matrixer, "subtraction must be between matrices"
-    return self + (b * (-1))
+    return self._ufunc(np.subtract, b.matrix, out)
+
+  def mul(self, b, out:"matrixer"=None) -> "matrixer":
+    """
+    Returns self * b, the matrix product if b is a matrix or the scaled matrix if b is a number.
+    When out is given, the result is written into its array and out is returned.
+    For a matrix product, out must not be self or b.
+
+    :param b: the matrix or number to multiply by
+    :param out: optional matrix of the right size to hold the result
+    :return: the product
+    """
+    assert type(b) in (matrixer, int, float), "can only multiply number or matrix"
+    if type(b) is not matrixer:
+      return self._ufunc(np.multiply, b, out)
+    if out is None:
+      return matrixer(np.dot(self.matrix, b.matrix))
+    assert out is not self and out is not b, "matrix product can't be written into its own input"
+    np.dot(self.matrix, b.matrix, out=out.matrix)
+    out.invalidate()
+    return out
+
+  def lazy(self) -> "lazymatrix":
+    """
+    Returns a lazy view of this matrix. Arithmetic on it builds an expression instead of
+    computing right away, see lazymatrix.
+
+    :return: the matrix as a leaf of a lazy expression
+    """
+    return lazymatrix("leaf", (self,), self.dim)
+
+  def _ufunc(self, f, b, out:"matrixer") -> "matrixer":
+    """
+    Applies an elementwise NumPy function to self and b, writing into out if given.
+    """
+    if out is None:
+      return matrixer(f(self.matrix, b))
+    assert type(out) is matrixer, "out must be a matrix"
+    assert np.can_cast(np.result_type(self.matrix, b), out.dtype, "same_kind"), "result does not fit the type of out"
+    f(self.matrix, b, out=out.matrix)
+    out.invalidate()
+    return out
 
   def det(self) -> Union[int, float]:
     """
     Returns the determinant of the matrix.
     The matrix must be a non-empty 2-dimensional square matrix.
     The determinant of an empty matrix is 1.
+    Integer matrices get an exact integer result (fraction-free Bareiss elimination),
+    others are computed by LU decomposition with partial pivoting. Both take O(n^3) time.
 
     :return: the determinant of the matrix
     """
 
     assert self.dim[0] == self.dim[1], "matrix must be square"
 
-    l = self.dim[0]  # length
-    m = self.matrix
+    return self.factor().det
+
 
-    def de(m, l):
-      if l == 0:
-        return 1
-      if l == 1:
-        return m[0, 0]
-      elif l == 2:
-        return (m[0, 0] * m[1, 1]) - (m[0, 1] * m[1, 0])
+def fingerprint(m:np.ndarray) -> bytes:
+  """
+  Returns a short digest of the content of an array, used to notice in-place changes.
+
+  :param m: the array to be digested
+  :return: the digest as bytes
+  """
+  h = hashlib.blake2b(np.ascontiguousarray(m), digest_size=16)
+  h.update(str((m.shape, m.dtype.str)).encode())
+  return h.digest()
+
+
+class factorization(object):
+  """
+  Lazily computed factorizations of a matrix and the values derived from them.
+  Each one is computed on first use and kept, so repeated requests cost nothing.
+  Get it through matrixer.factor() rather than initializing directly.
+  """
+  def __init__(self, mx:np.ndarray):
+    self.matrix = mx
+    self._lu = None
+    self._det = None
+    self._rank = None
+    self._inverse = None
+    self._qr = None
+    self._cholesky = None
+    self._cholesky_done = False
+
+  @property
+  def lu(self) -> tuple:
+    """(lu, piv, sign) as returned by lu_factor()."""
+    if self._lu is None:
+      self._lu = lu_factor(self.matrix)
+    return self._lu
+
+  @property
+  def singular(self) -> bool:
+    """True if the matrix is numerically singular."""
+    return lu_singular(self.lu[0], self.matrix)
+
+  @property
+  def det(self) -> Union[int, float]:
+    """The determinant, exact for integer matrices."""
+    if self._det is None:
+      if np.issubdtype(self.matrix.dtype, np.integer):
+        self._det = bareiss_det(self.matrix)
+      else:
+        lu, piv, sign = self.lu
+        self._det = sign * np.prod(np.diagonal(lu))
+    return self._det
+
+  @property
+  def rank(self) -> int:
+    """The numerical rank, works for non-square matrices too."""
+    if self._rank is None:
+      self._rank = int(np.linalg.matrix_rank(self.matrix))
+    return self._rank
+
+  @property
+  def inverse(self) -> np.ndarray:
+    """The inverse as a float array, do not modify it in place."""
+    if self._inverse is None:
+      assert not self.singular, "matrix is not invertible"
+      lu, piv, sign = self.lu
+      self._inverse = lu_solve(lu, piv, np.identity(self.matrix.shape[0]))
+    return self._inverse
+
+  @property
+  def qr(self) -> tuple:
+    """(q, r) from the reduced QR decomposition."""
+    if self._qr is None:
+      self._qr = np.linalg.qr(self.matrix)
+    return self._qr
+
+  @property
+  def cholesky(self) -> Union[np.ndarray, None]:
+    """The lower triangular Cholesky factor, or None if the matrix is not symmetric positive definite."""
+    if not self._cholesky_done:
+      m = self.matrix
+      # np.linalg.cholesky only reads the lower triangle, so anything short of exact symmetry would be solved wrongly
+      if m.shape[0] == m.shape[1] and np.array_equal(m, m.T):
+        try:
+          self._cholesky = np.linalg.cholesky(m)
+        except np.linalg.LinAlgError:
+          self._cholesky = None
+      self._cholesky_done = True
+    return self._cholesky
+
+  def solve(self, b:np.ndarray) -> np.ndarray:
+    """
+    Solves M * x = b with the cached factors in O(n^2) per column of b.
+    The Cholesky factor is used when the matrix is exactly symmetric and positive definite.
+
+    :param b: the right-hand side as a 1D or 2D array
+    :return: the solution x, with the same shape as b
+    """
+    if self._inverse is not None:
+      return self._inverse @ b
+    c = self.cholesky
+    if c is not None:
+      return tri_solve(c.T, tri_solve(c, b, lower=True), lower=False)
+    assert not self.singular, "matrix is not invertible"
+    lu, piv, sign = self.lu
+    return lu_solve(lu, piv, b)
+
+
+def bareiss_det(m:np.ndarray) -> int:
+  """
+  Returns the exact determinant of a square integer matrix by fraction-free Bareiss elimination.
+  Entries are handled as Python integers, so the result never overflows.
+
+  :param m: the square integer matrix
+  :return: the determinant as an integer
+  """
+  l = m.shape[0]
+  a = [[int(x) for x in row] for row in m]   # Python ints so intermediate values can't overflow
+  sign = 1
+  prev = 1   # the pivot of the previous step, every division by it is exact
+  for k in range(l - 1):
+    if a[k][k] == 0:
+      # swap in a row below with a non-zero entry in this column
+      for r in range(k + 1, l):
+        if a[r][k] != 0:
+          a[k], a[r] = a[r], a[k]
+          sign = -sign
+          break
       else:
-        result = 0
-        for col in range(l):
-          # expand matrix along the first row
-          left_piece = m[1:l, 0:col]
-          right_piece = m[1:l, col + 1:l]
-          piece = np.hstack((left_piece, right_piece))
+        return 0   # the whole column is zero
+    for i in range(k + 1, l):
+      for j in range(k + 1, l):
+        a[i][j] = (a[i][j] * a[k][k] - a[i][k] * a[k][j]) // prev
+    prev = a[k][k]
 
-          result += (-1) ** (col) * m[0, col] * de(piece, l - 1)
+  if l == 0:
+    return 1
+  return sign * a[l - 1][l - 1]
 
-        return result
 
-    return de(m, l)
+def lu_factor(m:np.ndarray) -> tuple:
+  """
+  Computes the LU decomposition of a square matrix with partial pivoting, so that P*M = L*U.
+  L (unit lower triangle, diagonal not stored) and U are packed into a single float matrix.
+
+  :param m: the square matrix to decompose, it is not modified
+  :return: (lu, piv, sign) where lu is the packed factors, piv[i] is the original row now in row i,
+           and sign is the sign of the permutation (1 or -1)
+  """
+  assert m.ndim == 2 and m.shape[0] == m.shape[1], "matrix must be square"
+
+  l = m.shape[0]
+  lu = np.array(m, dtype=float)
+  piv = np.arange(l)
+  sign = 1
+  for k in range(l):
+    p = k + np.argmax(np.abs(lu[k:, k]))   # largest entry in the column as the pivot
+    if p != k:
+      lu[[k, p]] = lu[[p, k]]
+      piv[[k, p]] = piv[[p, k]]
+      sign = -sign
+    if lu[k, k] == 0:
+      continue   # singular, the column below is already all zero
+    lu[k + 1:, k] /= lu[k, k]
+    # rank-1 update of the trailing submatrix
+    lu[k + 1:, k + 1:] -= np.outer(lu[k + 1:, k], lu[k, k + 1:])
+
+  return lu, piv, sign
+
+
+def cofactor_det(m:np.ndarray) -> Union[int, float]:
+  """
+  Returns the determinant by cofactor expansion along the first row.
+  Takes O(n!) time, only kept as a reference for check_det().
+
+  :param m: the square matrix
+  :return: the determinant of the matrix
+  """
+  l = m.shape[0]
+  if l == 0:
+    return 1
+  if l == 1:
+    return m[0, 0]
+  elif l == 2:
+    return (m[0, 0] * m[1, 1]) - (m[0, 1] * m[1, 0])
+  else:
+    result = 0
+    for col in range(l):
+      # expand matrix along the first row
+      piece = np.hstack((m[1:l, 0:col], m[1:l, col + 1:l]))
+      result += (-1) ** (col) * m[0, col] * cofactor_det(piece)
+
+    return result
+
+
+def check_det(maxsize:int=6, trial:int=20) -> bool:
+  """
+  Compares det() against the cofactor expansion on random matrices up to the given size.
+  Integer matrices must agree exactly, float matrices up to rounding error.
+
+  :param maxsize: the largest matrix size to be checked
+  :param trial: the number of random matrices to be checked per size and type
+  :return: True if every check passed, raises AssertionError otherwise
+  """
+  rng = np.random.default_rng(0)
+  for n in range(maxsize + 1):
+    for t in range(trial):
+      mi = rng.integers(-9, 10, (n, n))
+      assert matrixer(mi).det() == cofactor_det(mi), "integer determinant mismatch"
+      mf = rng.standard_normal((n, n))
+      expected = cofactor_det(mf)
+      assert abs(matrixer(mf).det() - expected) <= 1e-9 * max(1.0, abs(expected)), "float determinant mismatch"
+
+  return True
+
+
+def isint(s: str) -> bool:
+  """
+  Returns true if string is an integer with an optional leading '-', false otherwise.
+
+  :param s: string to be checked
+  :return: true/false
+  """
+  if s.startswith('-'):
+    s = s[1:]
+  return s.isdecimal()   # isnumeric() would also pass characters like '²' that int() rejects
+
+
+def isfloat(s: str) -> bool:
+  """
+  Returns true if string can be converted to float, false otherwise.
+
+  :param s: string to be checked
+  :return: true/false
+  """
+  try:
+    float(s)
+    return True
+  except ValueError:
+    return False
+
+
+def issci(s:str) -> bool:
+  """
+  Returns true is string is in proper scientific notation, false otherwise.
+  The exponent marker must be an uppercase 'E'.
+
+  :param s: string to be checked
+  :return: true/false
+  """
+  s = s.lstrip('-')   # negative is irrelevant for this
+  # shortest string denoting scientific notation is 3 characters long (e.g. 3e0)
+  if isfloat(s) and len(s) >= 3:
+    # s[1] must be either '.' (e.g. 3.00e8) or 'E' (e.g. 2e8) for positive
+    return 'E' in s and s[1] in ('.', 'E')
+
+  return False
 
 
 def ienter(row: int, col: int) -> matrixer:
@@ -132,7 +500,7 @@ def ienter(row: int, col: int) -> matrixer:
   while r != row:
     print(visual)
     new = input("Replace * with: ")
-    while not new.lstrip('-').isnumeric():
+    while not isint(new):
       new = input("Non-integer input, try again: ")
     mx[r, c] = int(new)
 
@@ -242,19 +610,6 @@ def enter(row:int, col:int, showto:int=2, sci:bool=False) -> matrixer:
   r = 0  # reset r for new iteration, c should've been reset from the first loop
   vis_i = 0  # this is the index of the first '*' among '*'s in visual
 
-  def isfloat(s: str) -> bool:
-    """
-    Returns true if string can be converted to float, false otherwise.
-
-    :param s: string to be checked
-    :return: true/false
-    """
-    try:
-      float(s)
-      return True
-    except ValueError:
-      return False
-
   while r != row:
     print(visual)
     if not sci:
@@ -266,21 +621,6 @@ def enter(row:int, col:int, showto:int=2, sci:bool=False) -> matrixer:
     else:
       new = input("Replace * with (in scientific notation, like 2.34E7): ").upper()
 
-      def issci(s:str) -> bool:
-        """
-        Returns true is string is in proper scientific notation, false otherwise.
-
-        :param s: string to be checked
-        :return: true/false
-        """
-        s = s.lstrip('-')   # negative is irrelevant for this
-        # shortest string denoting scientific notation is 3 characters long (e.g. 3e0)
-        if isfloat(s) and len(s) >= 3:
-          # s[1] must be either '.' (e.g. 3.00e8) or 'E' (e.g. 2e8) for positive
-          return 'E' in s and s[1] in ('.', 'E')
-
-        return False
-
       while not issci(new):
         new = input("Invalid scientific notation, try again: ").upper()
 
@@ -311,26 +651,131 @@ def enter(row:int, col:int, showto:int=2, sci:bool=False) -> matrixer:
   return matrixer(mx)
 
 
-def zero(row:int, col:int, dtype:type=float) -> matrixer:
+def load(source, integer:bool=False, sci:bool=False, chunk:int=4096) -> matrixer:
+  """
+  Reads a whole matrix at once instead of entering it cell by cell with ienter()/enter().
+  A .npy path is loaded directly. Anything else is read as text, one row per line with entries
+  separated by whitespace and/or commas; blank lines are skipped.
+  The text is parsed a chunk of lines at a time, so only one chunk of strings is held in memory.
+
+  :param source: a file path or an open text stream
+  :param integer: when set to True, every entry must be an integer, as in ienter()
+  :param sci: when set to True, every entry must be in scientific notation, as in enter(sci=True)
+  :param chunk: the number of lines to parse at once
+  :return: a matrix object representing the loaded matrix
+  """
+  assert not (integer and sci), "integer and sci can't both be set"
+  if type(source) is str:
+    if source.lower().endswith(".npy"):
+      return loadnpy(source, integer)
+    with open(source, 'r') as f:
+      return load(f, integer, sci, chunk)
+
+  if integer:
+    valid = isint
+    dtype = int
+  elif sci:
+    valid = issci
+    dtype = float
+  else:
+    valid = isfloat
+    dtype = float
+
+  blocks = []   # parsed arrays, one per chunk
+  col = None
+  rows = []
+  r = 0   # row number for error messages
+
+  def flush():
+    if rows:
+      blocks.append(np.array(rows, dtype))
+      rows.clear()
+
+  for line in source:
+    entries = line.replace(',', ' ').split()
+    if not entries:
+      continue
+    if sci:
+      entries = [e.upper() for e in entries]
+    if col is None:
+      col = len(entries)
+    assert len(entries) == col, "row " + str(r + 1) + " has " + str(len(entries)) + " entries instead of " + str(col)
+    for c in range(col):
+      assert valid(entries[c]), "invalid entry '" + entries[c] + "' at row " + str(r + 1) + ", column " + str(c + 1)
+    rows.append(entries)
+    r += 1
+    if len(rows) == chunk:
+      flush()
+  flush()
+
+  assert blocks, "no entries found"
+  return matrixer(np.concatenate(blocks))
+
+
+def loadnpy(path:str, integer:bool=False) -> matrixer:
+  """
+  Reads a matrix from a binary .npy file.
+
+  :param path: the file to be read
+  :param integer: when set to True, the file must hold integers
+  :return: a matrix object representing the loaded matrix
+  """
+  mx = np.load(path)
+  assert mx.ndim == 2, "file must hold a 2-dimensional matrix"
+  if integer:
+    assert np.issubdtype(mx.dtype, np.integer), "file does not hold integers"
+  else:
+    assert np.issubdtype(mx.dtype, np.number), "file does not hold numbers"
+  return matrixer(mx)
+
+
+def paste(block:str=None, integer:bool=False, sci:bool=False) -> matrixer:
+  """
+  Reads a matrix pasted as a block of text, in the same format as load().
+  If block is not given, takes console input line by line until an empty line is entered.
+
+  :param block: the text of the matrix
+  :param integer: when set to True, every entry must be an integer, as in ienter()
+  :param sci: when set to True, every entry must be in scientific notation, as in enter(sci=True)
+  :return: a matrix object representing the pasted matrix
+  """
+  if block is None:
+    print("Paste the matrix, then enter an empty line:")
+    lines = []
+    line = input()
+    while line.strip():
+      lines.append(line)
+      line = input()
+    return load(lines, integer, sci)
+  return load(block.splitlines(), integer, sci)
+
+
+def zero(row:int, col:int, dtype:type=float, sparse:bool=False) -> Union[matrixer, "sparsematrixer"]:
   """
   Returns a zero matrix of the given size. Entries are in float by default.
 
   :param row: number of rows
   :param col: number of columns
   :param dtype: set to int or float to control data type
+  :param sparse: when set to True, returns a sparsematrixer that stores no entries at all
   :return: the row by col zero matrix
   """
+  if sparse:
+    return sparsematrixer(np.zeros(0, dtype), np.zeros(0, int), np.zeros(row + 1, int), (row, col))
   return matrixer(np.zeros((row, col), dtype))
 
 
-def identity(n:int, dtype:type=float) -> matrixer:
+def identity(n:int, dtype:type=float, sparse:bool=False) -> Union[matrixer, "sparsematrixer"]:
   """
   Returns an identity matrix of the given size. Entries are in float by default.
 
   :param n: the size of the identity matrix
   :param dtype: set to int or float to control data type
+  :param sparse: when set to True, returns a sparsematrixer storing only the n diagonal entries
   :return: the n by n identity matrix
   """
+  if sparse:
+    return sparsematrixer(np.ones(n, dtype), np.arange(n), np.arange(n + 1), (n, n))
   return matrixer(np.identity(n, dtype))
 
 
@@ -339,34 +784,885 @@ def inverse(mat:matrixer) -> matrixer:
     Returns the inverse of a square matrix.
     The input matrix must be invertible.
     The output matrix will be in floats.
-    May not work correctly with matrices with extremely small entries.
+    The matrix is factored once and the result is cached on mat, so asking again for an
+    unchanged matrix only costs the O(n^2) change check and a copy.
 
     :param mat: the matrix to find the inverse of
     :return: the inverse of the input matrix
     """
     assert mat.dim[0] == mat.dim[1], "matrix must be square"
-    d = mat.det()
-    assert d < -0.00001 or d > 0.00001, "matrix is not invertible"
-    
-    l = mat.dim[0]
-    m = mat.matrix
-    result = np.zeros([l, l])
-    
-    for r in range(l):
-      for c in range(l):
-        # construct inverse by co-factor method
-        
-        # construct matrix minor (c,r)
-        top_left = m[0:c, 0:r]
-        top_right = m[0:c, r+1:l]
-        bot_left = m[c+1:l, 0:r]
-        bot_right = m[c+1:l, r+1:l]
-        top = np.hstack((top_left, top_right))
-        bottom = np.hstack((bot_left, bot_right))
-        piece = np.vstack((top, bottom))
-        piece = matrixer(piece)
-        
-        # assemble new matrix
-        result[r, c] = (-1) ** (c+r) * piece.det()
-      
-    return matrixer(result * (1/d))
+
+    return matrixer(mat.factor().inverse.copy())
+
+
+def solve(mat:matrixer, b:matrixer) -> matrixer:
+    """
+    Solves mat * x = b for x without forming the inverse of mat.
+    The input matrix must be square and invertible. b may have several columns,
+    in which case each column is solved for.
+    The factorization is cached on mat, so later solves with the same matrix cost O(n^2).
+
+    :param mat: the coefficient matrix
+    :param b: the right-hand side, with as many rows as mat
+    :return: the solution x in floats
+    """
+    assert type(b) is matrixer, "right-hand side must be a matrix"
+    assert mat.dim[0] == mat.dim[1], "matrix must be square"
+    assert b.dim[0] == mat.dim[0], "right-hand side must have as many rows as the matrix"
+
+    return matrixer(mat.factor().solve(b.matrix))
+
+
+def lu_singular(lu:np.ndarray, m:np.ndarray) -> bool:
+    """
+    Returns True if the LU factors describe a numerically singular matrix.
+    A pivot counts as zero when it is negligible compared to the scale of the original matrix,
+    so the test does not depend on the units the entries are in.
+
+    :param lu: the packed factors from lu_factor()
+    :param m: the matrix that was factored
+    :return: True if the matrix should be treated as singular
+    """
+    l = lu.shape[0]
+    if l == 0:
+      return False
+    tol = l * np.finfo(float).eps * np.abs(m).max()
+    return bool((np.abs(np.diagonal(lu)) <= tol).any())
+
+
+def lu_solve(lu:np.ndarray, piv:np.ndarray, b:np.ndarray) -> np.ndarray:
+    """
+    Solves M * x = b using the factors of M from lu_factor(), in O(n^2) per column of b.
+
+    :param lu: the packed factors from lu_factor()
+    :param piv: the row permutation from lu_factor()
+    :param b: the right-hand side as a 1D or 2D array
+    :return: the solution x, with the same shape as b
+    """
+    x = np.array(b, dtype=float)[piv]   # apply the row swaps
+    x = tri_solve(lu, x, lower=True, unit=True)
+    return tri_solve(lu, x, lower=False)
+
+
+def tri_solve(t:np.ndarray, b:np.ndarray, lower:bool, unit:bool=False) -> np.ndarray:
+    """
+    Solves T * x = b by substitution, where T is the lower or upper triangle of t.
+    Entries of t outside that triangle are ignored.
+
+    :param t: the matrix holding the triangle
+    :param b: the right-hand side as a 1D or 2D array
+    :param lower: True to use the lower triangle (forward substitution), False for the upper one
+    :param unit: when set to True, the diagonal is taken to be all ones and is not read
+    :return: the solution x, with the same shape as b
+    """
+    l = t.shape[0]
+    x = np.array(b, dtype=float)
+    rows = range(l) if lower else range(l - 1, -1, -1)
+    for i in rows:
+      if lower:
+        x[i] -= t[i, :i] @ x[:i]
+      else:
+        x[i] -= t[i, i + 1:] @ x[i + 1:]
+      if not unit:
+        x[i] /= t[i, i]
+
+    return x
+
+
+class matrixstack(object):
+  def __init__(self, mx:np.ndarray):
+    """
+    A stack of equally sized matrices held in one (N, row, col) array.
+    Every operation runs on the whole stack at once instead of looping over matrixer objects.
+    TO USERS: Please use stack() instead of initializing directly.
+    """
+    assert mx.ndim == 3, "stack must be a 3-dimensional array"
+    self.matrix = mx
+    self.dim = mx.shape
+    self.dtype = mx.dtype
+
+  def __repr__(self):
+    return str(self.matrix)
+
+  def __str__(self):
+    return str(self.matrix)
+
+  def __len__(self):
+    return self.dim[0]
+
+  def __getitem__(self, i:int) -> matrixer:
+    return matrixer(self.matrix[i])
+
+  def __add__(self, b):
+    assert type(b) is matrixstack, "addition must be between stacks"
+    return matrixstack(np.add(self.matrix, b.matrix))
+
+  def __sub__(self, b):
+    assert type(b) is matrixstack, "subtraction must be between stacks"
+    return matrixstack(np.subtract(self.matrix, b.matrix))
+
+  def __matmul__(self, b):
+    assert type(b) in (matrixstack, matrixer), "can only multiply stack or matrix"
+    # a single matrixer is broadcast against every matrix in the stack
+    return matrixstack(np.matmul(self.matrix, b.matrix))
+
+  def __mul__(self, b):
+    assert type(b) in (matrixstack, matrixer, int, float), "can only multiply number, stack or matrix"
+    if type(b) in (int, float):
+      return matrixstack(np.multiply(self.matrix, b))
+    else:
+      return self @ b
+
+  def det(self) -> np.ndarray:
+    """
+    Returns the determinant of every matrix in the stack.
+    The results are floats even for integer stacks, use matrixer.det() for exact values.
+
+    :return: 1D array of the N determinants
+    """
+    assert self.dim[1] == self.dim[2], "matrices must be square"
+    return np.linalg.det(self.matrix)
+
+  def inverse(self) -> "matrixstack":
+    """
+    Returns the stack of inverses. Every matrix in the stack must be invertible.
+
+    :return: the stack of inverses in floats
+    """
+    assert self.dim[1] == self.dim[2], "matrices must be square"
+    try:
+      return matrixstack(np.linalg.inv(self.matrix))
+    except np.linalg.LinAlgError:
+      assert False, "matrix is not invertible"
+
+  def solve(self, b) -> Union["matrixstack", matrixer]:
+    """
+    Solves A[i] * x[i] = b[i] for every matrix in the stack.
+
+    :param b: a matrixstack of right-hand sides, one per matrix,
+              or a single matrixer used as the right-hand side for every matrix
+    :return: the stack of solutions in floats,
+             or if b is a 1D matrixer, a (N, n) matrixer whose row i is the solution x[i]
+    """
+    assert type(b) in (matrixstack, matrixer), "right-hand side must be a stack or matrix"
+    assert self.dim[1] == self.dim[2], "matrices must be square"
+    rhs = b.matrix
+    vector = rhs.ndim == 1
+    if vector:
+      rhs = rhs[:, None]   # np.linalg.solve would read a stack of vectors as one matrix
+    if type(b) is matrixer:
+      rhs = np.broadcast_to(rhs, (self.dim[0],) + rhs.shape)
+    try:
+      x = np.linalg.solve(self.matrix, rhs)
+    except np.linalg.LinAlgError:
+      assert False, "matrix is not invertible"
+    if vector:
+      return matrixer(x[..., 0])
+    return matrixstack(x)
+
+  def tolist(self) -> list:
+    """
+    Returns the stack as a list of matrixer objects. The matrices share memory with the stack.
+
+    :return: list of N matrixer objects
+    """
+    return [matrixer(m) for m in self.matrix]
+
+
+def stack(mats:list) -> matrixstack:
+  """
+  Returns a stack built from a list of matrixer objects of the same size.
+
+  :param mats: the matrices to be stacked
+  :return: the stack holding a copy of every matrix
+  """
+  assert all(type(m) is matrixer for m in mats), "can only stack matrices"
+  assert len(mats) > 0, "need at least one matrix"
+  return matrixstack(np.stack([m.matrix for m in mats]))
+
+
+class sparsematrixer(object):
+  def __init__(self, data:np.ndarray, indices:np.ndarray, indptr:np.ndarray, dim:tuple):
+    """
+    A matrix in compressed sparse row (CSR) form. Only the non-zero entries are stored,
+    so memory scales with their number rather than with row * col.
+    The entries of row i are data[indptr[i]:indptr[i+1]], in the columns indices[indptr[i]:indptr[i+1]].
+    TO USERS: Please use sparse(), coo() or zero()/identity() with sparse=True instead of initializing directly.
+    """
+    self.data = data
+    self.indices = indices
+    self.indptr = indptr
+    self.dim = tuple(dim)
+    self.dtype = data.dtype
+
+  def __repr__(self):
+    return "sparse " + str(self.dim[0]) + "x" + str(self.dim[1]) + " matrix with " + str(self.nnz) + " stored entries"
+
+  def __str__(self):
+    return str(self.todense())
+
+  @property
+  def nnz(self) -> int:
+    return self.data.size
+
+  def tocoo(self) -> tuple:
+    """
+    Returns the entries in coordinate form.
+
+    :return: (rows, cols, values) as three 1D arrays
+    """
+    rows = np.repeat(np.arange(self.dim[0]), np.diff(self.indptr))
+    return rows, self.indices, self.data
+
+  def todense(self) -> matrixer:
+    """
+    Returns the same matrix as a dense matrixer.
+
+    :return: the dense matrix
+    """
+    mx = np.zeros(self.dim, self.dtype)
+    rows, cols, vals = self.tocoo()
+    mx[rows, cols] = vals
+    return matrixer(mx)
+
+  def transpose(self) -> "sparsematrixer":
+    """
+    Returns the transpose of the matrix, still in sparse form.
+
+    :return: the transposed matrix
+    """
+    rows, cols, vals = self.tocoo()
+    return coo(cols, rows, vals, (self.dim[1], self.dim[0]))
+
+  def __add__(self, b):
+    assert type(b) in (sparsematrixer, matrixer), "addition must be between matrices"
+    assert self.dim == b.dim, "matrices must have the same size"
+    if type(b) is matrixer:
+      mx = np.array(b.matrix, dtype=np.result_type(self.dtype, b.dtype))
+      rows, cols, vals = self.tocoo()
+      mx[rows, cols] += vals
+      return matrixer(mx)
+    r1, c1, v1 = self.tocoo()
+    r2, c2, v2 = b.tocoo()
+    return coo(np.concatenate((r1, r2)), np.concatenate((c1, c2)), np.concatenate((v1, v2)), self.dim)
+
+  def __sub__(self, b):
+    assert type(b) in (sparsematrixer, matrixer), "subtraction must be between matrices"
+    return self + (b * (-1))
+
+  def __mul__(self, b):
+    assert type(b) in (sparsematrixer, matrixer, int, float), "can only multiply number or matrix"
+    if type(b) in (int, float):
+      return sparsematrixer(self.data * b, self.indices, self.indptr, self.dim)
+    assert self.dim[1] == b.dim[0], "matrix sizes do not agree"
+    rows, cols, vals = self.tocoo()
+    if type(b) is matrixer:
+      # each stored entry (i, k) adds vals * b[k] to row i of the result, zero entries are never visited
+      m = b.matrix if b.matrix.ndim == 2 else b.matrix[:, None]
+      out = np.zeros((self.dim[0], m.shape[1]), np.result_type(self.dtype, m.dtype))
+      np.add.at(out, rows, vals[:, None] * m[cols])
+      return matrixer(out if b.matrix.ndim == 2 else out[:, 0])
+    # sparse * sparse: each stored entry (i, k) meets only the stored entries of row k of b
+    counts = np.diff(b.indptr)[cols]
+    total = counts.sum()
+    starts = np.repeat(b.indptr[cols], counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    pos = starts + offsets
+    return coo(np.repeat(rows, counts), b.indices[pos], np.repeat(vals, counts) * b.data[pos],
+               (self.dim[0], b.dim[1]))
+
+  def det(self) -> float:
+    """
+    Returns the determinant of the matrix by sparse Gaussian elimination.
+    Only stored entries and the fill-in they create are ever touched.
+
+    :return: the determinant of the matrix
+    """
+    assert self.dim[0] == self.dim[1], "matrix must be square"
+    result = sparse_eliminate(self)
+    if result is None:
+      return 0.0
+    pivots, order, upper, rhs = result
+    return permutation_sign(order) * np.prod(pivots)
+
+  def solve(self, b:matrixer) -> matrixer:
+    """
+    Solves self * x = b for x by sparse Gaussian elimination.
+    The matrix must be square and invertible.
+
+    :param b: the dense right-hand side, with as many rows as the matrix
+    :return: the solution x in floats
+    """
+    assert type(b) is matrixer, "right-hand side must be a matrix"
+    assert self.dim[0] == self.dim[1], "matrix must be square"
+    assert b.dim[0] == self.dim[0], "right-hand side must have as many rows as the matrix"
+    result = sparse_eliminate(self, b.matrix)
+    assert result is not None, "matrix is not invertible"
+    pivots, order, upper, rhs = result
+
+    # back substitution, pivot k sits in column k of the row order[k]
+    n = self.dim[0]
+    x = np.zeros((n,) + rhs.shape[1:])
+    for k in range(n - 1, -1, -1):
+      acc = rhs[order[k]].copy()
+      for col, val in upper[k].items():
+        if col != k:
+          acc -= val * x[col]
+      x[k] = acc / pivots[k]
+    return matrixer(x)
+
+
+def coo(rows:np.ndarray, cols:np.ndarray, vals:np.ndarray, dim:tuple) -> sparsematrixer:
+  """
+  Returns a sparse matrix built from coordinate (COO) entries.
+  Duplicate coordinates are summed and zero values are dropped.
+
+  :param rows: row index of each entry
+  :param cols: column index of each entry
+  :param vals: value of each entry
+  :param dim: (row, col) size of the matrix
+  :return: the matrix in CSR form
+  """
+  rows = np.asarray(rows, int)
+  cols = np.asarray(cols, int)
+  vals = np.asarray(vals)
+  order = np.lexsort((cols, rows))
+  rows, cols, vals = rows[order], cols[order], vals[order]
+  if rows.size:
+    # sum entries sharing the same coordinate
+    new = np.ones(rows.size, bool)
+    new[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+    starts = np.flatnonzero(new)
+    rows, cols, vals = rows[starts], cols[starts], np.add.reduceat(vals, starts)
+  keep = vals != 0
+  rows, cols, vals = rows[keep], cols[keep], vals[keep]
+  indptr = np.zeros(dim[0] + 1, int)
+  np.cumsum(np.bincount(rows, minlength=dim[0]), out=indptr[1:])
+  return sparsematrixer(vals, cols, indptr, dim)
+
+
+def sparse(mat:matrixer) -> sparsematrixer:
+  """
+  Returns the sparse form of a dense matrix.
+
+  :param mat: the matrix to be converted
+  :return: the matrix in CSR form
+  """
+  rows, cols = np.nonzero(mat.matrix)
+  return coo(rows, cols, mat.matrix[rows, cols], mat.dim)
+
+
+def sparse_eliminate(sp:sparsematrixer, b:np.ndarray=None) -> Union[tuple, None]:
+  """
+  Runs Gaussian elimination on a square sparse matrix, applying the same row operations to b.
+  Rows are kept as dictionaries of their non-zero entries. For each column, the pivot is the row with
+  the fewest entries among those whose entry is within a factor of 10 of the largest, which limits fill-in
+  while keeping the elimination stable.
+
+  :param sp: the matrix to be eliminated
+  :param b: optional dense right-hand side, a copy is modified
+  :return: (pivots, order, upper, rhs) where pivots[k] is the k-th pivot, order[k] the row it came from,
+           upper[k] that row as a dictionary after elimination and rhs the eliminated right-hand side;
+           None if the matrix is singular
+  """
+  n = sp.dim[0]
+  rowdicts = []
+  colrows = [set() for c in range(n)]   # unpivoted rows having an entry in each column
+  for i in range(n):
+    lo, hi = sp.indptr[i], sp.indptr[i + 1]
+    rowdicts.append(dict(zip(sp.indices[lo:hi].tolist(), sp.data[lo:hi].astype(float).tolist())))
+    for c in sp.indices[lo:hi].tolist():
+      colrows[c].add(i)
+  rhs = None if b is None else np.array(b, dtype=float)
+  tol = n * np.finfo(float).eps * (np.abs(sp.data).max() if sp.nnz else 0.0)
+
+  pivots = np.zeros(n)
+  order = []
+  upper = []
+  for k in range(n):
+    cand = colrows[k]
+    if not cand:
+      return None
+    largest = max(abs(rowdicts[r][k]) for r in cand)
+    if largest <= tol:
+      return None
+    p = min((r for r in cand if abs(rowdicts[r][k]) >= 0.1 * largest), key=lambda r: len(rowdicts[r]))
+    prow = rowdicts[p]
+    for c in prow:
+      colrows[c].discard(p)
+    for r in list(cand):
+      row = rowdicts[r]
+      factor = row[k] / prow[k]
+      for c, val in prow.items():
+        new = row.get(c, 0.0) - factor * val
+        if c == k or new == 0.0:
+          if c in row:
+            del row[c]
+            colrows[c].discard(r)
+        else:
+          if c not in row:
+            colrows[c].add(r)
+          row[c] = new
+      if rhs is not None:
+        rhs[r] -= factor * rhs[p]
+    pivots[k] = prow[k]
+    order.append(p)
+    upper.append(prow)
+
+  return pivots, order, upper, rhs
+
+
+def permutation_sign(perm:list) -> int:
+  """
+  Returns the sign of a permutation given as a list of the integers 0 to n-1.
+
+  :param perm: the permutation
+  :return: 1 if it is even, -1 if it is odd
+  """
+  sign = 1
+  seen = [False] * len(perm)
+  for start in range(len(perm)):
+    if seen[start]:
+      continue
+    # a cycle of length l takes l - 1 swaps
+    length = 0
+    i = start
+    while not seen[i]:
+      seen[i] = True
+      i = perm[i]
+      length += 1
+    if length % 2 == 0:
+      sign = -sign
+  return sign
+
+
+class lazymatrix(object):
+  def __init__(self, op:str, args:tuple, dim:tuple, coef:Union[int, float]=1):
+    """
+    A node of a lazy matrix expression. +, -, * and @ build new nodes instead of computing,
+    and evaluate() computes the whole expression at once:
+    chains of products are multiplied in the order needing the fewest operations,
+    sums, differences and scalings are collapsed into a single weighted sum written into one buffer,
+    and identical subexpressions are only computed once.
+    TO USERS: Please use matrixer.lazy() instead of initializing directly.
+    """
+    self.op = op   # "leaf", "add", "scale" or "matmul"
+    self.args = args
+    self.dim = dim
+    self.coef = coef
+    if op == "leaf":
+      self.key = ("leaf", id(args[0]))
+    else:
+      self.key = (op, coef) + tuple(a.key for a in args)
+
+  def __repr__(self):
+    if self.op == "leaf":
+      return "M" + str(self.dim)
+    if self.op == "scale":
+      return str(self.coef) + "*" + repr(self.args[0])
+    sign = " + " if self.op == "add" else " @ "
+    return "(" + repr(self.args[0]) + sign + repr(self.args[1]) + ")"
+
+  def __add__(self, b):
+    b = aslazy(b)
+    assert self.dim == b.dim, "matrices must have the same size"
+    return lazymatrix("add", (self, b), self.dim)
+
+  def __sub__(self, b):
+    return self + aslazy(b) * (-1)
+
+  def __neg__(self):
+    return self * (-1)
+
+  def __mul__(self, b):
+    assert type(b) in (lazymatrix, matrixer, int, float), "can only multiply number or matrix"
+    if type(b) in (int, float):
+      return lazymatrix("scale", (self,), self.dim, b)
+    return self @ b
+
+  def __rmul__(self, b):
+    assert type(b) in (int, float), "can only multiply number or matrix"
+    return self * b
+
+  def __matmul__(self, b):
+    b = aslazy(b)
+    assert self.dim[1] == b.dim[0], "matrix sizes do not agree"
+    return lazymatrix("matmul", (self, b), (self.dim[0], b.dim[1]))
+
+  def terms(self) -> list:
+    """
+    Returns the expression as a weighted sum, merging terms that are the same subexpression.
+
+    :return: list of [coefficient, node] where no node is a sum or a scaling
+    """
+    merged = {}
+    stack = [(1, self)]
+    while stack:
+      c, node = stack.pop()
+      if node.op == "add":
+        stack.extend((c, a) for a in node.args)
+      elif node.op == "scale":
+        stack.append((c * node.coef, node.args[0]))
+      elif node.key in merged:
+        merged[node.key][0] += c
+      else:
+        merged[node.key] = [c, node]
+    return [t for t in merged.values() if t[0] != 0]
+
+  def factors(self) -> tuple:
+    """
+    Returns the expression as a scaled chain of products, with the scalings pulled out.
+
+    :return: (coefficient, list of nodes in multiplication order) where no node is a product or a scaling
+    """
+    coef = 1
+    chain = []
+    stack = [self]
+    while stack:
+      node = stack.pop()
+      if node.op == "matmul":
+        stack.extend(reversed(node.args))   # left argument is processed first
+      elif node.op == "scale":
+        coef *= node.coef
+        stack.append(node.args[0])
+      else:
+        chain.append(node)
+    return coef, chain
+
+  def evaluate(self) -> matrixer:
+    """
+    Computes the expression.
+
+    :return: the result as a new matrix
+    """
+    result = evaluate_node(self, {})
+    if self.op == "leaf":
+      result = result.copy()
+    return matrixer(result)
+
+
+def aslazy(b) -> lazymatrix:
+  """
+  Returns b as a lazy node, wrapping it if it is a plain matrix.
+
+  :param b: a lazymatrix or matrixer
+  :return: the lazy node
+  """
+  assert type(b) in (lazymatrix, matrixer), "operand must be a matrix"
+  if type(b) is matrixer:
+    return b.lazy()
+  return b
+
+
+def chain_order(dims:list) -> list:
+  """
+  Finds the cheapest order to multiply a chain of matrices by dynamic programming.
+  Matrix i has the size dims[i] by dims[i+1].
+
+  :param dims: the n+1 sizes describing a chain of n matrices
+  :return: split[i][j] is the position k at which the product of matrices i..j is best split into i..k and k+1..j
+  """
+  n = len(dims) - 1
+  cost = [[0] * n for i in range(n)]
+  split = [[0] * n for i in range(n)]
+  for length in range(2, n + 1):
+    for i in range(n - length + 1):
+      j = i + length - 1
+      cost[i][j] = None
+      for k in range(i, j):
+        c = cost[i][k] + cost[k + 1][j] + dims[i] * dims[k + 1] * dims[j + 1]
+        if cost[i][j] is None or c < cost[i][j]:
+          cost[i][j] = c
+          split[i][j] = k
+  return split
+
+
+def evaluate_node(node:lazymatrix, memo:dict) -> np.ndarray:
+  """
+  Computes a lazy node, reusing the results of subexpressions already in memo.
+  The returned array may be shared with memo or with a leaf and must not be modified.
+
+  :param node: the node to be computed
+  :param memo: the results computed so far, keyed by node.key
+  :return: the result as an array
+  """
+  if node.key in memo:
+    return memo[node.key]
+
+  if node.op == "leaf":
+    result = node.args[0].matrix
+  elif node.op == "matmul":
+    coef, chain = node.factors()
+    mats = [evaluate_node(f, memo) for f in chain]
+    split = chain_order([m.shape[0] for m in mats] + [mats[-1].shape[1]])
+
+    def product(i, j):
+      if i == j:
+        return mats[i]
+      k = split[i][j]
+      return np.dot(product(i, k), product(k + 1, j))
+
+    result = product(0, len(mats) - 1)
+    if coef != 1:
+      # a product of two or more matrices is a fresh array, so it can be scaled in place if the type allows
+      inplace = len(mats) > 1 and np.can_cast(np.result_type(result, coef), result.dtype, "same_kind")
+      result = np.multiply(result, coef, out=result if inplace else None)
+  else:
+    terms = node.terms()
+    if not terms:
+      result = np.zeros(node.dim)
+    else:
+      parts = [(c, evaluate_node(t, memo)) for c, t in terms]
+      dtype = np.result_type(*[p for c, p in parts], *[c for c, p in parts])
+      # every term is accumulated into the same buffer, and scaled terms go through one scratch buffer
+      result = np.multiply(parts[0][1], parts[0][0], dtype=dtype)
+      scratch = None
+      for c, p in parts[1:]:
+        if c == 1:
+          np.add(result, p, out=result)
+        elif c == -1:
+          np.subtract(result, p, out=result)
+        else:
+          if scratch is None:
+            scratch = np.empty_like(result)
+          np.multiply(p, c, out=scratch)
+          np.add(result, scratch, out=result)
+
+  memo[node.key] = result
+  return result
+
+
+def blocked_mul(a:matrixer, b:matrixer, tile:int=512, workers:int=None) -> matrixer:
+  """
+  Returns the matrix product a * b computed tile by tile on a thread pool.
+  Each task owns one tile of the result and sums the products of the matching tiles of a and b,
+  so tasks never write to the same memory. NumPy releases the GIL inside np.dot, so the tasks run in parallel.
+
+  :param a: the left matrix
+  :param b: the right matrix
+  :param tile: the side length of the square tiles
+  :param workers: the number of threads, the number of CPUs by default
+  :return: the product
+  """
+  assert type(a) is matrixer and type(b) is matrixer, "can only multiply matrices"
+  assert a.dim[1] == b.dim[0], "matrix sizes do not agree"
+  assert tile > 0, "tile must be positive"
+
+  x, y = a.matrix, b.matrix
+  out = np.zeros((x.shape[0], y.shape[1]), np.result_type(x, y))
+
+  def task(i, j):
+    t = out[i:i + tile, j:j + tile]
+    for k in range(0, x.shape[1], tile):
+      t += np.dot(x[i:i + tile, k:k + tile], y[k:k + tile, j:j + tile])
+
+  with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+    jobs = [pool.submit(task, i, j) for i in range(0, out.shape[0], tile) for j in range(0, out.shape[1], tile)]
+    for job in jobs:
+      job.result()   # re-raises any error from the task
+
+  return matrixer(out)
+
+
+def blocked_lu(mat:matrixer, tile:int=256, workers:int=None) -> tuple:
+  """
+  Computes the same LU decomposition as lu_factor() by a blocked right-looking algorithm.
+  Each panel of tile columns is factored on its own, then the trailing submatrix is updated
+  tile by tile on a thread pool.
+
+  :param mat: the square matrix to decompose, it is not modified
+  :param tile: the number of columns per panel and the side length of the update tiles
+  :param workers: the number of threads, the number of CPUs by default
+  :return: (lu, piv, sign) in the same form as lu_factor()
+  """
+  assert mat.dim[0] == mat.dim[1], "matrix must be square"
+  assert tile > 0, "tile must be positive"
+
+  l = mat.dim[0]
+  lu = np.array(mat.matrix, dtype=float)
+  piv = np.arange(l)
+  sign = 1
+
+  def update(i, j, k, e):
+    lu[i:i + tile, j:j + tile] -= np.dot(lu[i:i + tile, k:e], lu[k:e, j:j + tile])
+
+  with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+    for k in range(0, l, tile):
+      e = min(k + tile, l)   # end of the panel
+      # factor the panel, swapping whole rows
+      for j in range(k, e):
+        p = j + np.argmax(np.abs(lu[j:, j]))
+        if p != j:
+          lu[[j, p]] = lu[[p, j]]
+          piv[[j, p]] = piv[[p, j]]
+          sign = -sign
+        if lu[j, j] == 0:
+          continue
+        lu[j + 1:, j] /= lu[j, j]
+        lu[j + 1:, j + 1:e] -= np.outer(lu[j + 1:, j], lu[j, j + 1:e])
+      if e == l:
+        break
+      # rows of U to the right of the panel
+      lu[k:e, e:] = tri_solve(lu[k:e, k:e], lu[k:e, e:], lower=True, unit=True)
+      # trailing update, each task owns one tile
+      jobs = [pool.submit(update, i, j, k, e) for i in range(e, l, tile) for j in range(e, l, tile)]
+      for job in jobs:
+        job.result()
+
+  return lu, piv, sign
+
+
+def benchmark_blocked(sizes:tuple=(256, 512, 1024, 2048), tile:int=512, workers:int=None, repeat:int=3) -> dict:
+  """
+  Prints to the console the time taken by np.dot, blocked_mul(), lu_factor() and blocked_lu()
+  on random square matrices of each size, taking the best of repeat runs.
+  Note that np.dot may already be multi-threaded by the BLAS library NumPy is linked against.
+
+  :param sizes: the matrix sizes to be tried
+  :param tile: the tile size passed to blocked_mul() and blocked_lu()
+  :param workers: the number of threads, the number of CPUs by default
+  :param repeat: the number of runs per measurement
+  :return: a dictionary mapping each size to a dictionary of the best times in seconds
+  """
+  rng = np.random.default_rng(0)
+  results = {}
+
+  def best(f):
+    times = []
+    for r in range(repeat):
+      start = time.perf_counter()
+      f()
+      times.append(time.perf_counter() - start)
+    return min(times)
+
+  print("size".rjust(6) + "np.dot".rjust(12) + "blocked_mul".rjust(14) + "lu_factor".rjust(12) + "blocked_lu".rjust(13))
+  for n in sizes:
+    a = matrixer(rng.standard_normal((n, n)))
+    b = matrixer(rng.standard_normal((n, n)))
+    results[n] = {
+      "np.dot": best(lambda: np.dot(a.matrix, b.matrix)),
+      "blocked_mul": best(lambda: blocked_mul(a, b, tile, workers)),
+      "lu_factor": best(lambda: lu_factor(a.matrix)),
+      "blocked_lu": best(lambda: blocked_lu(a, tile, workers)),
+    }
+    print(str(n).rjust(6) + "".join(format(t, ".4f").rjust(w) for t, w in zip(results[n].values(), (12, 14, 12, 13))))
+
+  return results
+
+
+def openmatrix(path:str, mode:str="r", dtype:type=None, shape:tuple=None) -> matrixer:
+  """
+  Returns a matrix backed by a file on disk through np.memmap, so it does not have to fit in memory.
+  A .npy file carries its own type and size. Any other file is read as raw binary,
+  in which case dtype and shape must be given.
+  Use stream_add(), stream_scale() and stream_mul() to compute with it without loading it all.
+
+  :param path: the file to be opened
+  :param mode: "r" for read-only, "r+" to allow writing back to the file, "c" for copy-on-write
+  :param dtype: the type of the entries of a raw file
+  :param shape: the (row, col) size of a raw file
+  :return: the matrix with a memmap as its array
+  """
+  assert mode in ("r", "r+", "c"), "mode must be r, r+ or c"
+  if path.lower().endswith(".npy"):
+    mx = np.load(path, mmap_mode=mode)
+  else:
+    assert dtype is not None and shape is not None, "dtype and shape are needed for a raw file"
+    mx = np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+  assert mx.ndim == 2, "file must hold a 2-dimensional matrix"
+  return matrixer(mx)
+
+
+def stream_rows(nbytes_per_row:int, budget:int) -> int:
+  """
+  Returns how many rows fit in the memory budget, at least one.
+
+  :param nbytes_per_row: the size of one row in bytes
+  :param budget: the memory budget in bytes
+  :return: the number of rows per block
+  """
+  return max(1, budget // max(1, nbytes_per_row))
+
+
+def stream_output(out:str, shape:tuple, dtype) -> np.memmap:
+  """
+  Creates a .npy file of the given size and type and returns it as a writable memmap.
+
+  :param out: the path of the file to be created
+  :param shape: the (row, col) size
+  :param dtype: the type of the entries
+  :return: the memmap to write the result into
+  """
+  return np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=shape)
+
+
+def stream_add(a:matrixer, b:matrixer, out:str, budget:int=64 * 2 ** 20) -> matrixer:
+  """
+  Writes a + b to a .npy file, processing a block of rows at a time so that
+  only about budget bytes of each operand are in memory at once.
+
+  :param a: the first matrix, usually from openmatrix()
+  :param b: the second matrix of the same size
+  :param out: the path of the .npy file to hold the result
+  :param budget: the memory budget per block in bytes
+  :return: the result, backed by the output file
+  """
+  assert type(a) is matrixer and type(b) is matrixer, "addition must be between matrices"
+  assert a.dim == b.dim, "matrices must have the same size"
+  res = stream_output(out, a.dim, np.result_type(a.dtype, b.dtype))
+  step = stream_rows(res.strides[0], budget)
+  for r in range(0, a.dim[0], step):
+    np.add(a.matrix[r:r + step], b.matrix[r:r + step], out=res[r:r + step])
+  res.flush()
+  return matrixer(res)
+
+
+def stream_scale(a:matrixer, c:Union[int, float], out:str, budget:int=64 * 2 ** 20) -> matrixer:
+  """
+  Writes c * a to a .npy file, processing a block of rows at a time.
+
+  :param a: the matrix, usually from openmatrix()
+  :param c: the number to multiply by
+  :param out: the path of the .npy file to hold the result
+  :param budget: the memory budget per block in bytes
+  :return: the result, backed by the output file
+  """
+  assert type(a) is matrixer, "can only scale a matrix"
+  assert type(c) in (int, float), "can only scale by a number"
+  res = stream_output(out, a.dim, np.result_type(a.matrix, c))
+  step = stream_rows(res.strides[0], budget)
+  for r in range(0, a.dim[0], step):
+    np.multiply(a.matrix[r:r + step], c, out=res[r:r + step])
+  res.flush()
+  return matrixer(res)
+
+
+def stream_mul(a:matrixer, b:matrixer, out:str, budget:int=64 * 2 ** 20) -> matrixer:
+  """
+  Writes the matrix product a * b to a .npy file.
+  The result is computed a block of rows at a time, and each block of rows of a
+  is multiplied against b a block of its rows at a time, so neither operand is loaded whole.
+  The blocks of a and b and the accumulated rows together fit in budget.
+
+  :param a: the left matrix, usually from openmatrix()
+  :param b: the right matrix
+  :param out: the path of the .npy file to hold the result
+  :param budget: the memory budget per block in bytes
+  :return: the result, backed by the output file
+  """
+  assert type(a) is matrixer and type(b) is matrixer, "can only multiply matrices"
+  assert a.dim[1] == b.dim[0], "matrix sizes do not agree"
+  res = stream_output(out, (a.dim[0], b.dim[1]), np.result_type(a.dtype, b.dtype))
+  # up to half the budget holds acc and the product of one step, both rstep rows of the result,
+  # and rstep is kept to the side of a square block of a in a third of the budget so kstep doesn't shrink to 1
+  rowbytes = b.dim[1] * res.dtype.itemsize
+  rstep = min(stream_rows(2 * rowbytes, budget // 2), max(1, math.isqrt(budget // 3 // a.dtype.itemsize)))
+  # the rest holds the rstep x kstep block of a and the kstep x col block of b
+  kstep = stream_rows(rstep * a.dtype.itemsize + b.dim[1] * b.dtype.itemsize, budget - 2 * rstep * rowbytes)
+  for r in range(0, a.dim[0], rstep):
+    acc = np.zeros((min(rstep, a.dim[0] - r), b.dim[1]), res.dtype)
+    for k in range(0, a.dim[1], kstep):
+      acc += np.dot(a.matrix[r:r + rstep, k:k + kstep], b.matrix[k:k + kstep])
+    res[r:r + rstep] = acc
+  res.flush()
+  return matrixer(res)
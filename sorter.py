@@ -1,13 +1,247 @@
-def sortdict(dct: dict, bykey: bool=False, descend: bool=False) -> list[list]:
+import gc
+import heapq
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+import numpy as np
+from contextlib import contextmanager
+from operator import itemgetter
+from typing import Iterable, Iterator, Union
+
+
+def sortdict(dct: dict, bykey: bool=False, descend: bool=False, asarray: bool=False) -> Union[list[list], np.ndarray]:
     """
     Returns a list of lists containing the content of the dictionary, sorted in ascending order by value.
     Each list represents [key, value].
+    Entries that compare equal keep the order they have in the dictionary, in either direction.
     :param dct: the dictionary to be sorted (note: all keys/values must be comparable to each other)
     :param bykey: when set to True, sorts by keys instead
     :param descend: when set to True, sorts in descending order
+    :param asarray: when set to True, returns a NumPy structured array with the fields "key" and "value"
+    instead of a list of lists, see sortarray(). If the keys or values can't be held exactly in an array,
+    the list of lists is returned anyway.
     :return: the sorted dictionary as a list of lists
     """
 
+    if asarray:
+        result = sortarray(dct, bykey, descend)
+        if result is not None:
+            return result
+
+    with nogc():   # the garbage collector would otherwise scan again and again while the lists are made
+        dlist = [[key, value] for key, value in dct.items()]
+    # list.sort() is a stable O(n log n) merge sort that extracts each sort key only once,
+    # and reverse=True keeps equal entries in their original order
+    dlist.sort(key=itemgetter(0 if bykey else 1), reverse=descend)
+    return dlist
+
+
+def sortarray(dct: dict, bykey: bool=False, descend: bool=False) -> Union[np.ndarray, None]:
+    """
+    Returns the content of a dictionary of numbers as a NumPy structured array with the fields "key" and "value",
+    sorted in the same order as sortdict(). The keys and values are copied into parallel arrays and
+    ordered by a stable np.argsort, so no Python object is made per entry.
+    :param dct: the dictionary to be sorted
+    :param bykey: when set to True, sorts by keys instead
+    :param descend: when set to True, sorts in descending order
+    :return: the sorted structured array, or None if the keys or values can't be held exactly in an array (see numeric())
+    """
+
+    keys = numeric(dct.keys(), len(dct))
+    values = numeric(dct.values(), len(dct))
+    if keys is None or values is None:
+        return None
+
+    field = keys if bykey else values
+    if descend:
+        # sort the order-reversed numbers ascending, so that equal entries still keep their original order
+        field = -field if field.dtype.kind == "f" else ~field
+    order = np.argsort(field, kind="stable")
+    result = np.empty(len(dct), dtype=[("key", keys.dtype), ("value", values.dtype)])
+    result["key"] = keys[order]
+    result["value"] = values[order]
+    return result
+
+
+def numeric(column: Iterable, n: int) -> Union[np.ndarray, None]:
+    """
+    Returns the numbers of column as an int64 array if they are all ints, or as a float array if some are floats.
+    Python and NumPy ints and floats are accepted. Returns None if anything else is in column (bools and NaN included),
+    or if a number would change in the array: an int too large for int64, an int mixed with floats that float
+    can't hold exactly, or a float wider than float64.
+    :param column: the keys or values of a dictionary
+    :param n: the number of entries in column
+    :return: the array, or None
+    """
+
+    kinds = set(map(type, column))
+    for kind in kinds:
+        if issubclass(kind, (bool, np.bool_)) or not issubclass(kind, (int, float, np.integer, np.floating)):
+            return None
+        if issubclass(kind, np.floating) and np.dtype(kind).itemsize > 8:
+            return None
+    if all(issubclass(kind, (int, np.integer)) for kind in kinds):
+        try:
+            return np.fromiter(map(int, column), dtype=np.int64, count=n)
+        except OverflowError:
+            return None
+    # compared as Python numbers, an int is equal to its float only if the float holds it exactly
+    try:
+        if any(int(x) != float(x) for x in column if isinstance(x, (int, np.integer))):
+            return None
+    except OverflowError:   # an int beyond the range of float
+        return None
+    arr = np.fromiter(column, dtype=float, count=n)
+    if np.isnan(arr).any():
+        return None
+    return arr
+
+
+@contextmanager
+def nogc():
+    """
+    Pauses the garbage collector for the duration of a with block that makes many objects.
+    """
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def topk(dct: dict, k: int, bykey: bool=False, descend: bool=True, orderbykey: bool=False) -> list[list]:
+    """
+    Returns the k largest (or smallest) entries of the dictionary as a list of lists, like the first k of sortdict(),
+    but in O(n log k) time by keeping only the best k entries in a heap instead of sorting everything.
+    Each list represents [key, value]. Ties are broken the same way as in sortdict().
+    :param dct: the dictionary to select from (note: all keys/values must be comparable to each other)
+    :param k: the number of entries to return
+    :param bykey: when set to True, selects by keys instead of values
+    :param descend: when set to True (the default), selects the largest entries, otherwise the smallest
+    :param orderbykey: when set to True, the selected entries are returned sorted by key
+    (in the same direction) instead of by what they were selected by
+    :return: the selected entries as a list of lists
+    """
+
+    compare = itemgetter(0 if bykey else 1)
+    # heapq.nlargest/nsmallest are documented to match sorted(...)[:k], so ties stay in dictionary order
+    if descend:
+        selected = heapq.nlargest(k, ([key, value] for key, value in dct.items()), key=compare)
+    else:
+        selected = heapq.nsmallest(k, ([key, value] for key, value in dct.items()), key=compare)
+    if orderbykey and not bykey:
+        selected.sort(key=itemgetter(0), reverse=descend)
+    return selected
+
+
+def externalsort(pairs: Iterable, bykey: bool=False, descend: bool=False, budget: int=256 * 2 ** 20,
+                 tmpdir: str=None, fanin: int=128) -> Iterator[list]:
+    """
+    Sorts (key, value) pairs that may not fit in memory, yielding them as [key, value] lists in the same order
+    sortdict() would give for a dictionary with the pairs in that order.
+    Pairs are read until about budget bytes are held, sorted, and spilled to a temporary file as a sorted run.
+    The runs are then merged back k-way (at most fanin files at a time) and yielded one by one.
+    Unlike a dictionary, repeated keys are all kept.
+    The temporary files are deleted once the generator is exhausted or closed.
+    :param pairs: any iterable of (key, value) pairs, such as dict.items() or a generator reading a file
+    :param bykey: when set to True, sorts by keys instead
+    :param descend: when set to True, sorts in descending order
+    :param budget: the approximate memory in bytes to use for each run
+    :param tmpdir: the directory to hold the temporary files, the system default if not given
+    :param fanin: the most runs to merge at once; more are first merged into bigger runs
+    :return: a generator of the sorted [key, value] lists
+    """
+
+    assert fanin >= 2, "fanin must be at least 2"
+    compare = itemgetter(0 if bykey else 1)
+    with tempfile.TemporaryDirectory(dir=tmpdir) as folder:
+        runs = []
+        run = []
+        size = 0
+        for key, value in pairs:
+            run.append([key, value])
+            size += sys.getsizeof(key) + sys.getsizeof(value) + 72   # 72 for the list holding them
+            if size >= budget:
+                runs.append(spillrun(run, compare, descend, folder, len(runs)))
+                run = []
+                size = 0
+        if not runs:
+            # everything fit in memory, no need to touch the disk
+            run.sort(key=compare, reverse=descend)
+            yield from run
+            return
+        if run:
+            runs.append(spillrun(run, compare, descend, folder, len(runs)))
+        del run
+
+        count = len(runs)
+        while len(runs) > fanin:
+            # merge the oldest runs first so that equal entries stay in input order
+            merged = os.path.join(folder, "run" + str(count) + ".bin")
+            count += 1
+            writerun(heapq.merge(*[readrun(r) for r in runs[:fanin]], key=compare, reverse=descend), merged)
+            for r in runs[:fanin]:
+                os.remove(r)
+            runs = [merged] + runs[fanin:]   # the merged run holds the oldest entries, so it goes first
+
+        yield from heapq.merge(*[readrun(r) for r in runs], key=compare, reverse=descend)
+
+
+def spillrun(run: list, compare, descend: bool, folder: str, number: int) -> str:
+    """
+    Sorts a run in memory and writes it to a file in the folder.
+    :return: the path of the file
+    """
+
+    run.sort(key=compare, reverse=descend)
+    path = os.path.join(folder, "run" + str(number) + ".bin")
+    writerun(run, path)
+    return path
+
+
+def writerun(items: Iterable, path: str, block: int=4096):
+    """
+    Writes [key, value] lists to a file as a sequence of pickled blocks of up to block entries each,
+    which is much more compact and faster to read back than pickling them one by one.
+    """
+
+    with open(path, "wb") as f:
+        buffer = []
+        for item in items:
+            buffer.append(item)
+            if len(buffer) == block:
+                pickle.dump(buffer, f, pickle.HIGHEST_PROTOCOL)
+                buffer = []
+        if buffer:
+            pickle.dump(buffer, f, pickle.HIGHEST_PROTOCOL)
+
+
+def readrun(path: str) -> Iterator[list]:
+    """
+    Yields the [key, value] lists written by writerun(), holding one block in memory at a time.
+    """
+
+    with open(path, "rb") as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+
+def sortdict_recursive(dct: dict, bykey: bool=False, descend: bool=False) -> list[list]:
+    """
+    The previous recursive three-way quicksort behind sortdict(), kept as a reference for benchmark().
+    Takes quadratic time and recursion depth on already sorted input.
+    """
+
     dlist = [[key, value] for key, value in dct.items()]
 
     if len(dlist) <= 1:
@@ -29,6 +263,35 @@ def sortdict(dct: dict, bykey: bool=False, descend: bool=False) -> list[list]:
                 L[item[0]] = item[1]
 
         if descend:
-            return sortdict(G, bykey=bykey, descend=True) + E + sortdict(L, bykey=bykey, descend=True)
+            return sortdict_recursive(G, bykey=bykey, descend=True) + E + sortdict_recursive(L, bykey=bykey, descend=True)
         else:
-            return sortdict(L, bykey=bykey) + E + sortdict(G, bykey=bykey)
+            return sortdict_recursive(L, bykey=bykey) + E + sortdict_recursive(G, bykey=bykey)
+
+
+def benchmark(n: int=10 ** 6, recursive: bool=True) -> dict:
+    """
+    Prints to the console the time taken by sortdict() on a dictionary of n random float values,
+    and on one whose values are already sorted.
+    :param n: the number of entries
+    :param recursive: when set to True, also times sortdict_recursive() on the random dictionary for comparison
+    (it can't handle the sorted one)
+    :return: a dictionary mapping the name of each measurement to the time in seconds
+    """
+
+    rand_dict = {i: random.random() for i in range(n)}
+    sorted_dict = {i: float(i) for i in range(n)}
+    results = {}
+
+    def measure(name, f, dct):
+        start = time.perf_counter()
+        f(dct)
+        results[name] = time.perf_counter() - start
+        print(name + ": " + str(round(results[name], 3)) + "s")
+
+    measure("sortdict, random values", sortdict, rand_dict)
+    measure("sortdict, sorted values", sortdict, sorted_dict)
+    measure("sortdict descending by key", lambda d: sortdict(d, bykey=True, descend=True), rand_dict)
+    measure("sortdict as array, random values", lambda d: sortdict(d, asarray=True), rand_dict)
+    if recursive:
+        measure("sortdict_recursive, random values", sortdict_recursive, rand_dict)
+    return results